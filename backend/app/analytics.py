@@ -0,0 +1,151 @@
+import asyncio
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .counters import apply_counter_deltas
+from .models import ArchivedDream, Dream, DreamTag, UserDailyStats
+
+RECENT_DAYS = 14
+
+
+def stats_day(created_at):
+    return timezone.localdate(created_at)
+
+
+def apply_daily_stats(deltas):
+    """
+    Apply {(user_id, day, mood): delta} increments to UserDailyStats.
+    Rows that drop to zero are removed so the table only holds active days.
+    """
+    apply_counter_deltas(UserDailyStats, ('user_id', 'day', 'mood'), deltas)
+
+
+def record_dreams(dreams, sign=1):
+    deltas = {}
+    for dream in dreams:
+        key = (dream.user_id, stats_day(dream.created_at), dream.mood)
+        deltas[key] = deltas.get(key, 0) + sign
+    apply_daily_stats(deltas)
+
+
+def rebuild_daily_stats(user_ids=None, batch_size=2000):
+    """Recompute UserDailyStats from the Dream and ArchivedDream tables."""
+    stats = UserDailyStats.objects.all()
+    counts = {}
+    for dreams in (Dream.objects.all(), ArchivedDream.objects.all()):
+        if user_ids is not None:
+            dreams = dreams.filter(user_id__in=user_ids)
+        rows = (dreams.annotate(day=TruncDate('created_at'))
+                .values('user_id', 'day', 'mood')
+                .annotate(count=Count('id'))
+                .order_by())
+        for r in rows:
+            key = (r['user_id'], r['day'], r['mood'])
+            counts[key] = counts.get(key, 0) + r['count']
+    if user_ids is not None:
+        stats = stats.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        stats.delete()
+        UserDailyStats.objects.bulk_create(
+            (UserDailyStats(user_id=user_id, day=day, mood=mood, count=count)
+             for (user_id, day, mood), count in counts.items()),
+            batch_size=batch_size,
+        )
+
+
+# The queries behind AnalyticsView, all served from the rollup and tag index
+
+COUNT_SUM = Coalesce(Sum('count'), Value(0))
+
+
+def total_query(user):
+    return UserDailyStats.objects.filter(user=user)
+
+
+def this_month_query(user, today):
+    return UserDailyStats.objects.filter(user=user, day__gte=today.replace(day=1), day__lte=today)
+
+
+def mood_query(user):
+    # Dreams without a mood are reported with a zero count, as Count('mood') did
+    return (UserDailyStats.objects.filter(user=user)
+            .values('mood')
+            .annotate(total=Coalesce(Sum('count', filter=Q(mood__isnull=False)), Value(0)))
+            .order_by('-total', 'mood'))
+
+
+def tag_query(user):
+    return (DreamTag.objects.filter(user=user)
+            .values('tag')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'tag'))
+
+
+def activity_query(user, start):
+    return (UserDailyStats.objects.filter(user=user, day__gte=start)
+            .values('day')
+            .annotate(total=Sum('count'))
+            .order_by('day'))
+
+
+def recent_start(today):
+    return today - timedelta(days=RECENT_DAYS - 1)
+
+
+def assemble_analytics(total, this_month, mood_rows, tag_rows, day_rows, today):
+    mood_dist = [{'mood': m['mood'], 'count': m['total']} for m in mood_rows]
+    daily_map = {row['day']: row['total'] for row in day_rows}
+    start = recent_start(today)
+
+    return {
+        'totalDreams': total,
+        'thisMonth': this_month,
+        'mostCommonMood': mood_dist[0]['mood'] if mood_dist else None,
+        'topTags': [{'tag': t['tag'], 'count': t['count']} for t in tag_rows],
+        'moodDistribution': mood_dist,
+        'recentActivity': [
+            {'date': start + timedelta(days=i), 'count': daily_map.get(start + timedelta(days=i), 0)}
+            for i in range(RECENT_DAYS)
+        ],
+    }
+
+
+def get_analytics(user):
+    today = timezone.localdate()
+    return assemble_analytics(
+        total=total_query(user).aggregate(total=COUNT_SUM)['total'],
+        this_month=this_month_query(user, today).aggregate(total=COUNT_SUM)['total'],
+        mood_rows=list(mood_query(user)),
+        tag_rows=list(tag_query(user)),
+        day_rows=list(activity_query(user, recent_start(today))),
+        today=today,
+    )
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+
+async def aget_analytics(user):
+    """Async get_analytics, the independent aggregates run concurrently."""
+    today = timezone.localdate()
+    total, this_month, mood_rows, tag_rows, day_rows = await asyncio.gather(
+        total_query(user).aaggregate(total=COUNT_SUM),
+        this_month_query(user, today).aaggregate(total=COUNT_SUM),
+        _alist(mood_query(user)),
+        _alist(tag_query(user)),
+        _alist(activity_query(user, recent_start(today))),
+    )
+    return assemble_analytics(
+        total=total['total'],
+        this_month=this_month['total'],
+        mood_rows=mood_rows,
+        tag_rows=tag_rows,
+        day_rows=day_rows,
+        today=today,
+    )
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, similar, trending
+from .models import ArchivedDream, Dream
+from .signals import deletes_handled
+
+# Dream columns copied to ArchivedDream
+ARCHIVED_COLUMNS = (
+    "id", "user_id", "title", "content", "mood", "tags", "is_public", "heart_count", "created_at", "updated_at",
+)
+
+
+def archive_cutoff(days=None):
+    """
+    The creation time dreams are archived before. Trending counters are not
+    kept for archived dreams, so it may not fall inside a trending window.
+    """
+    if days is None:
+        days = getattr(settings, "DREAM_ARCHIVE_AFTER_DAYS", 365)
+    longest = max(length for length, _ in trending.WINDOWS.values())
+    if timedelta(days=days) < longest:
+        raise ValueError(f"Dreams can only be archived after {longest.days} days or more")
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_batch(cutoff, is_public, batch_size):
+    """
+    Move the oldest `batch_size` dreams created before `cutoff` with the given
+    visibility to ArchivedDream, in one transaction. Returns how many moved.
+    """
+    with transaction.atomic():
+        # Oldest first through the (is_public, created_at, id) feed index
+        rows = list(
+            Dream.objects.filter(is_public=is_public, created_at__lt=cutoff)
+            .order_by("created_at", "id")
+            .values(*ARCHIVED_COLUMNS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        # Both statements commit together, a stopped run leaves every dream
+        # in exactly one of the tables
+        ArchivedDream.objects.bulk_create([ArchivedDream(**row) for row in rows])
+        # Still counted, tagged and hearted as ArchivedDreams, so none of
+        # the delete bookkeeping applies
+        with deletes_handled():
+            Dream.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+        # Only hot dreams are suggested as similar
+        if is_public:
+            similar.record(removed_ids=[row["id"] for row in rows])
+
+    for user_id in {row["user_id"] for row in rows}:
+        cache.bump_user(user_id)
+    if is_public:
+        cache.bump_public()
+    return len(rows)
+
+
+def archive_dreams(cutoff, batch_size=500, limit=None):
+    """
+    Archive every dream created before `cutoff`, one committed batch at a
+    time, yielding the size of each batch. Stopping at any point loses
+    nothing, the next run picks up the remaining dreams.
+    """
+    moved = 0
+    for is_public in (False, True):
+        while limit is None or moved < limit:
+            size = batch_size if limit is None else min(batch_size, limit - moved)
+            count = archive_batch(cutoff, is_public, size)
+            if not count:
+                break
+            moved += count
+            yield count
@@ -0,0 +1,143 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django.utils.timezone import localdate
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+
+from . import cache, reaction_buffer
+from .analytics import aget_analytics
+from .authentication import CachedTokenAuthentication
+from .etags import analytics_etag, dreams_etag, public_feed_etag
+from .models import Dream, DreamTag
+from .pagination import InvalidCursor, KeysetPaginator
+from .projections import DREAMS, PUBLIC_DREAMS, InvalidFieldset
+from .reactions import embed_hearted, hearted_ids, with_buffered_counts
+from .serializers import AnalyticsSerializer
+
+
+class QueryParamsRequest:
+    """Just enough of a DRF Request for KeysetPaginator."""
+
+    def __init__(self, request):
+        self.query_params = request.GET
+
+
+class AsyncAPIView(View):
+    """
+    Base for async, read-only versions of the API views. Authenticates with
+    CachedTokenAuthentication, answers If-None-Match like etags.conditional
+    and renders JSON like DRF, without holding a worker thread while the
+    database is queried.
+    """
+
+    etag_func = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await sync_to_async(CachedTokenAuthentication().authenticate)(request)
+        except exceptions.AuthenticationFailed as e:
+            return self.render({"detail": e.detail}, status=401)
+        if auth is None:
+            return self.render({"detail": "Authentication credentials were not provided."}, status=401)
+        request.user, request.auth = auth
+
+        etag = None
+        if self.etag_func is not None:
+            etag = await sync_to_async(self.etag_func)(request)
+        if etag is not None:
+            etag = quote_etag(etag)
+            if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+            if etag in if_none_match or "*" in if_none_match:
+                return self.finalize(HttpResponseNotModified(), etag)
+
+        response = await super().dispatch(request, *args, **kwargs)
+        return self.finalize(response, etag)
+
+    def finalize(self, response, etag):
+        if response.status_code in (200, 304):
+            if etag:
+                response["ETag"] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ["Authorization"])
+        return response
+
+    def render(self, data, status=200, hit=None):
+        response = HttpResponse(JSONRenderer().render(data), content_type="application/json", status=status)
+        if status == 401:
+            response["WWW-Authenticate"] = "Token"
+        if hit is not None:
+            response["X-Cache"] = "HIT" if hit else "MISS"
+        return response
+
+
+class AsyncPublicDreamsView(AsyncAPIView):
+    etag_func = staticmethod(public_feed_etag)
+
+    async def get(self, request):
+        paginator = KeysetPaginator(QueryParamsRequest(request))
+        include_hearted = "hearted" in request.GET.get("include", "").split(",")
+        try:
+            projection = PUBLIC_DREAMS.from_params(request.GET, required=["id"] if include_hearted else [])
+        except InvalidFieldset as e:
+            return self.render({"error": str(e)}, status=400)
+
+        async def build():
+            queryset = paginator.page_queryset(projection.rows(Dream.objects.filter(is_public=True)))
+            if reaction_buffer.is_enabled():
+                # The buffer's counts have to match the rows read, see ReactionBuffer.add_counts
+                rows, next_cursor = await sync_to_async(with_buffered_counts)(lambda: paginator.split(queryset))
+            else:
+                rows, next_cursor = paginator.split([row async for row in queryset.aiterator()])
+            return paginator.get_response_data(projection.map(rows), next_cursor)
+
+        try:
+            data, hit = await cache.aget_or_build(
+                "public", cache.PUBLIC_SCOPE, [paginator.cursor, paginator.page_size, projection.cache_key], build
+            )
+        except InvalidCursor as e:
+            return self.render({"error": str(e)}, status=400)
+
+        if include_hearted:
+            ids = [item["id"] for item in data["results"]]
+            data = embed_hearted(data, await sync_to_async(hearted_ids)(ids, request.user) if ids else ())
+        return self.render(data, hit=hit)
+
+
+class AsyncDreamListView(AsyncAPIView):
+    etag_func = staticmethod(dreams_etag)
+
+    async def get(self, request):
+        tag = request.GET.get("tag")
+        try:
+            projection = DREAMS.from_params(request.GET)
+        except InvalidFieldset as e:
+            return self.render({"error": str(e)}, status=400)
+
+        async def build():
+            dreams = Dream.objects.filter(user=request.user)
+            if tag:
+                dreams = dreams.filter(
+                    id__in=DreamTag.objects.filter(user=request.user, tag=tag).values("dream_id")
+                )
+            return projection.map([row async for row in projection.rows(dreams).aiterator()])
+
+        data, hit = await cache.aget_or_build(
+            "dreams", cache.user_scope(request.user.id), [tag, projection.cache_key], build
+        )
+        return self.render(data, hit=hit)
+
+
+class AsyncAnalyticsView(AsyncAPIView):
+    etag_func = staticmethod(analytics_etag)
+
+    async def get(self, request):
+        async def build():
+            return AnalyticsSerializer(await aget_analytics(request.user)).data
+
+        data, hit = await cache.aget_or_build(
+            "analytics", cache.user_scope(request.user.id), [str(localdate())], build
+        )
+        return self.render(data, hit=hit)
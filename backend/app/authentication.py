@@ -0,0 +1,112 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+SHARED_PREFIX = "dreamauth:token:"
+
+
+class TokenLRUCache:
+    """A small thread-safe LRU of token key -> (user, token) with a TTL."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache():
+    global _local_cache
+    if _local_cache is None:
+        with _local_cache_lock:
+            if _local_cache is None:
+                _local_cache = TokenLRUCache(
+                    getattr(settings, "DREAM_AUTH_CACHE_SIZE", 1024),
+                    getattr(settings, "DREAM_AUTH_CACHE_TTL", 60),
+                )
+    return _local_cache
+
+
+def is_shared():
+    return getattr(settings, "DREAM_AUTH_CACHE_SHARED", False)
+
+
+def get_shared_cache():
+    return caches[getattr(settings, "DREAM_AUTH_CACHE_ALIAS", "default")]
+
+
+def invalidate_token(key):
+    get_local_cache().delete(key)
+    if is_shared():
+        get_shared_cache().delete(SHARED_PREFIX + key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers resolved tokens for a short TTL, so
+    most requests skip the Token/User lookup. Entries live in a bounded
+    in-process LRU, or in Django's cache when DREAM_AUTH_CACHE_SHARED is set
+    so that all workers see the same entries and invalidations.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = self.get_cached(key)
+        if entry is None:
+            user, token = super().authenticate_credentials(key)
+            # Drop related objects so the cached user carries no request state
+            user._state.fields_cache = {}
+            token._state.fields_cache = {}
+            entry = (user, token)
+            self.set_cached(key, entry)
+
+        # Hand out copies, views may cache related objects on request.user
+        user, token = copy.copy(entry[0]), copy.copy(entry[1])
+        token.user = user
+        return user, token
+
+    def get_cached(self, key):
+        if is_shared():
+            return get_shared_cache().get(SHARED_PREFIX + key)
+        return get_local_cache().get(key)
+
+    def set_cached(self, key, entry):
+        if is_shared():
+            get_shared_cache().set(SHARED_PREFIX + key, entry, getattr(settings, "DREAM_AUTH_CACHE_TTL", 60))
+        else:
+            get_local_cache().set(key, entry)
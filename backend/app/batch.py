@@ -0,0 +1,134 @@
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedDream, Dream
+from .serializers import DreamSerializer
+from .signals import deletes_handled, dreams_created, dreams_deleted, dreams_updated, loaded_value
+
+OPERATIONS = ("create", "update", "delete")
+
+
+class InvalidBatch(Exception):
+    pass
+
+
+def _dream_id(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _targeted_ids(operations):
+    ids = set()
+    for operation in operations:
+        if isinstance(operation, dict) and operation.get("op") in ("update", "delete"):
+            dream_id = _dream_id(operation.get("id"))
+            if dream_id is not None:
+                ids.add(dream_id)
+    return ids
+
+
+def apply_batch(user, operations):
+    """
+    Validate mixed create/update/delete operations on the user's dreams with
+    DreamSerializer and apply the valid ones in one transaction, with one
+    bulk_create, one bulk_update and one IN delete. Invalid operations are
+    reported and skipped. Returns the per-operation results, in order, and
+    whether any public dream was touched.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch("operations must be a non-empty list")
+    maximum = getattr(settings, "DREAM_BATCH_MAX_OPERATIONS", 500)
+    if len(operations) > maximum:
+        raise InvalidBatch(f"At most {maximum} operations per batch")
+
+    # Every dream the batch targets, with one query per table
+    ids = _targeted_ids(operations)
+    existing = Dream.objects.filter(user=user).in_bulk(ids) if ids else {}
+    missing = ids - existing.keys()
+    archived = set(
+        ArchivedDream.objects.filter(user=user, pk__in=missing).values_list("pk", flat=True)
+    ) if missing else set()
+
+    results = []
+    created, updated, deleted = [], [], []
+    fields = set()
+    seen = set()
+    for operation in operations:
+        if not isinstance(operation, dict):
+            results.append({"status": 400, "errors": {"non_field_errors": ["Expected a JSON object"]}})
+            continue
+        op = operation.get("op")
+        result = {"op": op}
+        results.append(result)
+        if op not in OPERATIONS:
+            result.update(status=400, errors={"op": [f"Must be one of: {', '.join(OPERATIONS)}"]})
+            continue
+
+        if op == "create":
+            serializer = DreamSerializer(data=operation.get("data", {}))
+            if not serializer.is_valid():
+                result.update(status=400, errors=serializer.errors)
+                continue
+            dream = Dream(user=user, **serializer.validated_data)
+            created.append(dream)
+            result.update(status=201, dream=dream)
+            continue
+
+        result["id"] = operation.get("id")
+        dream_id = _dream_id(operation.get("id"))
+        if dream_id is None:
+            result.update(status=400, errors={"id": ["Not a valid dream id"]})
+        elif dream_id in seen:
+            result.update(status=400, errors={"id": ["Dream appears more than once in the batch"]})
+        elif dream_id in archived:
+            result.update(status=409, errors={"id": ["Archived dreams are read-only"]})
+        elif dream_id not in existing:
+            result.update(status=404, errors={"id": ["Dream not found"]})
+        if "errors" in result:
+            continue
+        seen.add(dream_id)
+        dream = existing[dream_id]
+
+        if op == "delete":
+            deleted.append(dream)
+            result.update(status=204)
+            continue
+
+        serializer = DreamSerializer(dream, data=operation.get("data", {}), partial=True)
+        if not serializer.is_valid():
+            result.update(status=400, errors=serializer.errors)
+            continue
+        for name, value in serializer.validated_data.items():
+            setattr(dream, name, value)
+        fields.update(serializer.validated_data)
+        updated.append(dream)
+        result.update(status=200, dream=dream)
+
+    with transaction.atomic():
+        if created:
+            Dream.objects.bulk_create(created)
+            dreams_created(created)
+        if updated:
+            # bulk_update skips auto_now
+            now = timezone.now()
+            for dream in updated:
+                dream.updated_at = now
+            Dream.objects.bulk_update(updated, sorted(fields | {"updated_at"}))
+            dreams_updated(updated)
+        if deleted:
+            dreams_deleted(deleted)
+            with deletes_handled():
+                Dream.objects.filter(pk__in=[d.pk for d in deleted]).delete()
+
+    for result in results:
+        if "dream" in result:
+            result["data"] = DreamSerializer(result.pop("dream")).data
+    touched_public = any(
+        d.is_public or loaded_value(d, "is_public") for d in created + updated + deleted
+    )
+    return results, touched_public
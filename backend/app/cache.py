@@ -0,0 +1,183 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+PREFIX = "dreamcache"
+PUBLIC_SCOPE = "public"
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def get_cache():
+    return caches[getattr(settings, "DREAM_CACHE_ALIAS", "default")]
+
+
+def is_shared():
+    """
+    Whether every worker process sees the same cache. Versions in a
+    per-process cache only move with that process's own writes.
+    """
+    return getattr(settings, "DREAM_CACHE_SHARED", False)
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def profile_scope(user_id):
+    return f"profile:{user_id}"
+
+
+def _version_key(scope):
+    return f"{PREFIX}:version:{scope}"
+
+
+def _initial_version():
+    # Start from the clock so a version key lost to eviction or a restart
+    # never reuses a number that older cached entries were stored under
+    return time.time_ns() // 1000
+
+
+async def aget_version(scope):
+    cache = get_cache()
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def get_version(scope):
+    cache = get_cache()
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(scope):
+    cache = get_cache()
+    key = _version_key(scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def bump_user(user_id):
+    bump_version(user_scope(user_id))
+
+
+def bump_profile(user_id):
+    bump_version(profile_scope(user_id))
+
+
+def bump_public():
+    bump_version(PUBLIC_SCOPE)
+
+
+def _record(namespace, outcome):
+    with _lock:
+        counters = _stats.setdefault(namespace, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+
+def stats():
+    """Hit/miss counters of this process, per namespace."""
+    with _lock:
+        return {namespace: dict(counters) for namespace, counters in _stats.items()}
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def _entry_key(namespace, scope, version, parts):
+    digest = hashlib.md5(repr(tuple(parts)).encode()).hexdigest()
+    return f"{PREFIX}:{namespace}:{scope}:{version}:{digest}"
+
+
+def make_key(namespace, scope, parts=()):
+    return _entry_key(namespace, scope, get_version(scope), parts)
+
+
+def get_or_build(namespace, scope, parts, builder):
+    """
+    Return (value, hit) for a versioned cache entry, calling builder() on a
+    miss. Bumping the scope version makes every older entry unreachable.
+    """
+    cache = get_cache()
+    key = make_key(namespace, scope, parts)
+    value = cache.get(key)
+    if value is not None:
+        _record(namespace, "hits")
+        return value, True
+
+    _record(namespace, "misses")
+    value = builder()
+    cache.set(key, value, getattr(settings, "DREAM_CACHE_TIMEOUT", 300))
+    return value, False
+
+
+def _latest_key(namespace, scope, parts):
+    digest = hashlib.md5(repr(tuple(parts)).encode()).hexdigest()
+    return f"{PREFIX}:{namespace}:{scope}:latest:{digest}"
+
+
+def store(namespace, scope, parts, value):
+    """Cache value under the current version, and as the latest value built."""
+    cache = get_cache()
+    timeout = getattr(settings, "DREAM_CACHE_TIMEOUT", 300)
+    cache.set(make_key(namespace, scope, parts), value, timeout)
+    cache.set(_latest_key(namespace, scope, parts), value, getattr(settings, "DREAM_CACHE_STALE_TIMEOUT", 86400))
+
+
+def get_or_refresh(namespace, scope, parts, builder, refresh):
+    """
+    Like get_or_build, but a miss is answered with the latest value built
+    for these parts under an older version, if there is one, and refresh()
+    is called to rebuild it off the request (it should end with store()).
+    Returns (value, "HIT" | "STALE" | "MISS").
+    """
+    cache = get_cache()
+    value = cache.get(make_key(namespace, scope, parts))
+    if value is not None:
+        _record(namespace, "hits")
+        return value, "HIT"
+
+    _record(namespace, "misses")
+    stale = cache.get(_latest_key(namespace, scope, parts))
+    if stale is not None:
+        refresh()
+        # A refresh that ran inline has stored the current value already
+        value = cache.get(make_key(namespace, scope, parts))
+        if value is not None:
+            return value, "MISS"
+        return stale, "STALE"
+
+    value = builder()
+    store(namespace, scope, parts, value)
+    return value, "MISS"
+
+
+async def aget_or_build(namespace, scope, parts, builder):
+    """Async get_or_build, builder is a coroutine function."""
+    cache = get_cache()
+    key = _entry_key(namespace, scope, await aget_version(scope), parts)
+    value = await cache.aget(key)
+    if value is not None:
+        _record(namespace, "hits")
+        return value, True
+
+    _record(namespace, "misses")
+    value = await builder()
+    await cache.aset(key, value, getattr(settings, "DREAM_CACHE_TIMEOUT", 300))
+    return value, False
@@ -0,0 +1,120 @@
+import gzip
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Types worth compressing, the API mostly sends JSON and NDJSON
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+_accept_re = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def available_encodings():
+    # In order of preference
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(request):
+    """The best encoding the client accepts, or None."""
+    header = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    if not header or not getattr(settings, "DREAM_COMPRESSION", False):
+        return None
+    accepted = {}
+    for part in header.lower().split(","):
+        match = _accept_re.match(part)
+        if not match:
+            continue
+        try:
+            q = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1)] = q
+    for encoding in available_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0))
+        if q > 0:
+            return encoding
+    return None
+
+
+def is_compressible(response):
+    content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+    return any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+
+def min_compressed_size():
+    return getattr(settings, "DREAM_COMPRESSION_MIN_SIZE", 1024)
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=getattr(settings, "DREAM_BROTLI_QUALITY", 5))
+    # mtime=0 keeps the output stable, so cached bodies stay byte-identical
+    return gzip.compress(data, compresslevel=getattr(settings, "DREAM_GZIP_LEVEL", 6), mtime=0)
+
+
+class StreamCompressor:
+    """Compresses a stream chunk by chunk, each one sent as soon as it is compressed."""
+
+    def __init__(self, encoding):
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=getattr(settings, "DREAM_BROTLI_QUALITY", 5))
+        else:
+            # gzip framing from zlib
+            self.compressor = zlib.compressobj(
+                getattr(settings, "DREAM_GZIP_LEVEL", 6), zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+        self.encoding = encoding
+
+    def process(self, chunk):
+        if self.encoding == "br":
+            return self.compressor.process(chunk) + self.compressor.flush()
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks as it is consumed."""
+    compressor = StreamCompressor(encoding)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, encoding):
+    """compress_stream for the async iterators of async streaming responses."""
+    compressor = StreamCompressor(encoding)
+    async for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def mark_encoded(response, encoding, length=None):
+    """Headers of a response whose body is encoded with `encoding`."""
+    response["Content-Encoding"] = encoding
+    if length is not None:
+        response["Content-Length"] = str(length)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    weaken_etag(response)
+
+
+def weaken_etag(response):
+    # The ETag names the uncompressed representation, weaken it like
+    # django.middleware.gzip does
+    etag = response.get("ETag")
+    if etag and etag.startswith('"'):
+        response["ETag"] = "W/" + etag
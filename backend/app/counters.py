@@ -0,0 +1,28 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def apply_counter_deltas(model, fields, deltas):
+    """
+    Apply {key: delta} increments to the `count` of `model` rows, where
+    each key holds the values of `fields` in order. Missing rows are
+    created for positive deltas and rows that drop to zero are removed.
+    """
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        lookup = dict(zip(fields, key))
+        rows = model.objects.filter(**lookup)
+        with transaction.atomic():
+            if rows.update(count=F('count') + delta):
+                if delta < 0:
+                    rows.filter(count__lte=0).delete()
+                continue
+            if delta < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    model.objects.create(count=delta, **lookup)
+            except IntegrityError:
+                # Created concurrently, fall back to the increment
+                rows.update(count=F('count') + delta)
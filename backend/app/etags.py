@@ -0,0 +1,78 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.timezone import localdate
+from django.views.decorators.http import condition
+
+from . import cache, compression
+from .routers import read_alias
+
+
+def _query_digest(request):
+    return hashlib.md5(request.GET.urlencode().encode()).hexdigest()[:12]
+
+
+# ETags are built from the cache versions in app.cache, which every write
+# bumps, so they can be checked without running the view or its queries.
+# With a per-process cache another worker's writes would not change them,
+# so none are sent unless the cache is shared. Views that read from the
+# replica compute theirs inside replica_reads, to name the snapshot read.
+
+def shared_versions(etag_func):
+    @wraps(etag_func)
+    def wrapper(request, *args, **kwargs):
+        if not cache.is_shared():
+            return None
+        return etag_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+@shared_versions
+def dreams_etag(request, *args, **kwargs):
+    user_id = request.user.id
+    return f"dreams-{user_id}-{cache.get_version(cache.user_scope(user_id))}-{read_alias()}-{_query_digest(request)}"
+
+
+@shared_versions
+def public_feed_etag(request, *args, **kwargs):
+    return f"public-{cache.get_version(cache.PUBLIC_SCOPE)}-{read_alias()}-{_query_digest(request)}"
+
+
+@shared_versions
+def analytics_etag(request, *args, **kwargs):
+    user_id = request.user.id
+    return f"analytics-{user_id}-{cache.get_version(cache.user_scope(user_id))}-{read_alias()}-{localdate()}"
+
+
+@shared_versions
+def profile_etag(request, *args, **kwargs):
+    user_id = request.user.id
+    return f"profile-{user_id}-{cache.get_version(cache.profile_scope(user_id))}"
+
+
+def conditional(etag_func):
+    """
+    Answer If-None-Match with 304 before the view runs. Responses must be
+    revalidated by clients and are private to the authenticated user.
+    """
+    def decorator(view_method):
+        conditional_view = condition(etag_func=etag_func)(view_method)
+
+        @wraps(view_method)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Views that encode their own body, see PublicDreamsView, had no
+            # ETag to weaken yet when they did
+            if response.has_header("Content-Encoding"):
+                compression.weaken_etag(response)
+            if response.status_code in (200, 304):
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ["Authorization"])
+            return response
+
+        return wrapper
+
+    return method_decorator(decorator)
@@ -0,0 +1,154 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class UnknownJob(Exception):
+    pass
+
+
+def task(name):
+    """Register a function as the job `name`. Its arguments must be JSON."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+
+    return decorator
+
+
+def is_eager():
+    """Whether jobs run inline in enqueue() instead of on a worker."""
+    return getattr(settings, "DREAM_JOBS_EAGER", False)
+
+
+def has_worker():
+    """Whether a run_jobs worker is deployed to pick up queued jobs."""
+    return getattr(settings, "DREAM_JOBS_WORKER", False)
+
+
+def enqueue(name, *args, dedupe_key=None, delay=0, max_attempts=None, **kwargs):
+    """
+    Queue the job `name` and return its row. With a dedupe_key, a job with
+    the same key that has not started yet is returned instead of adding
+    another one. When DREAM_JOBS_EAGER is set the job runs right away and
+    None is returned, there is no row.
+    """
+    if name not in _registry:
+        raise UnknownJob(name)
+    if is_eager():
+        _registry[name](*args, **kwargs)
+        return None
+
+    job = Job(
+        name=name, args=list(args), kwargs=kwargs, dedupe_key=dedupe_key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, "DREAM_JOB_MAX_ATTEMPTS", 5),
+    )
+    if dedupe_key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status=Job.QUEUED).first()
+        if existing is None:
+            # Claimed between the insert and the lookup, queue it again
+            return enqueue(name, *args, dedupe_key=dedupe_key, delay=delay, max_attempts=max_attempts, **kwargs)
+        return existing
+
+
+def backoff(attempts):
+    """Seconds before retry number `attempts`, doubling up to a cap, with jitter."""
+    base = getattr(settings, "DREAM_JOB_BACKOFF", 2)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, "DREAM_JOB_BACKOFF_MAX", 3600))
+    return delay * random.uniform(1, 1.25)
+
+
+def requeue_stale():
+    """Put jobs back whose worker stopped without finishing them."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, "DREAM_JOB_LOCK_TIMEOUT", 600))
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    requeued = 0
+    for job in stale:
+        requeued += _finish_attempt(job, "Worker stopped while running the job")
+    return requeued
+
+
+def claim(worker_id, limit=1):
+    """Mark up to `limit` due jobs as running for this worker and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by("run_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # Writes are serialized, so no other worker can claim these in between
+        Job.objects.filter(id__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now,
+        )
+        return list(Job.objects.filter(id__in=ids, locked_by=worker_id, status=Job.RUNNING).order_by("run_at", "id"))
+
+
+def _finish_attempt(job, error):
+    """
+    Record a failed attempt: queue a retry with backoff, or mark the job
+    failed once it is out of attempts. Returns 1 if it was retried.
+    """
+    job.attempts += 1
+    job.last_error = error
+    job.locked_by = None
+    job.locked_at = None
+    if job.attempts >= job.max_attempts:
+        job.status = Job.FAILED
+        job.save(update_fields=["status", "attempts", "last_error", "locked_by", "locked_at"])
+        return 0
+
+    job.status = Job.QUEUED
+    job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+    try:
+        with transaction.atomic():
+            job.save(update_fields=["status", "attempts", "last_error", "locked_by", "locked_at", "run_at"])
+    except IntegrityError:
+        # The same work was queued again meanwhile, that job covers it
+        job.delete()
+    return 1
+
+
+def run(job):
+    """Run one claimed job. Returns True if it succeeded."""
+    func = _registry.get(job.name)
+    try:
+        if func is None:
+            raise UnknownJob(job.name)
+        func(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception("Job %s (%s) failed", job.id, job.name)
+        _finish_attempt(job, traceback.format_exc())
+        return False
+
+    Job.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def work(worker_id, limit=1):
+    """Claim and run up to `limit` due jobs, returns how many ran."""
+    jobs = claim(worker_id, limit)
+    for job in jobs:
+        run(job)
+    return len(jobs)
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.archive import archive_cutoff, archive_dreams
+
+
+class Command(BaseCommand):
+    help = (
+        "Move dreams older than DREAM_ARCHIVE_AFTER_DAYS to the archive table (see app/archive.py). "
+        "Each batch commits on its own, so the command can be stopped and run again at any time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Archive dreams older than this (default DREAM_ARCHIVE_AFTER_DAYS)")
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "DREAM_ARCHIVE_BATCH_SIZE", 500))
+        parser.add_argument("--limit", type=int, help="Stop after archiving this many dreams")
+
+    def handle(self, *args, **options):
+        try:
+            cutoff = archive_cutoff(options["days"])
+        except ValueError as e:
+            raise CommandError(e)
+        moved = 0
+        for count in archive_dreams(cutoff, options["batch_size"], options["limit"]):
+            moved += count
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Archived {moved} dream(s)")
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} dream(s) created before {cutoff:%Y-%m-%d %H:%M}"))
@@ -0,0 +1,131 @@
+import http.client
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+# (label, WSGI path, ASGI path)
+ENDPOINTS = [
+    ("public feed", "/app/dreams/public/", "/app/async/dreams/public/"),
+    ("dream list", "/app/dreams/", "/app/async/dreams/"),
+    ("analytics", "/app/analytics/", "/app/async/analytics/"),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Server on port {port} did not start")
+
+
+def run_load(port, path, token, concurrency, duration):
+    """Hit one URL from `concurrency` keep-alive clients for `duration` seconds."""
+    counts = [0] * concurrency
+    errors = [0] * concurrency
+    deadline = time.monotonic() + duration
+
+    def worker(i):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        headers = {"Authorization": f"Token {token}"}
+        while time.monotonic() < deadline:
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    counts[i] += 1
+                else:
+                    errors[i] += 1
+            except (OSError, http.client.HTTPException):
+                errors[i] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    return {"rps": round(sum(counts) / elapsed, 1), "requests": sum(counts), "errors": sum(errors)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/second of the read-heavy endpoints under uvicorn (async views) "
+        "and under the threaded WSGI server (sync views). Seed data first, e.g. with seed_dreams."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Username to authenticate as (default: first user)")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per endpoint")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec("uvicorn") is None:
+            raise CommandError("uvicorn is required: pip install uvicorn")
+
+        users = User.objects.order_by("id")
+        user = users.filter(username=options["user"]).first() if options["user"] else users.first()
+        if user is None:
+            raise CommandError("No user to authenticate as, seed some data first")
+        token, _ = Token.objects.get_or_create(user=user)
+
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings"))
+        wsgi_port, asgi_port = free_port(), free_port()
+        servers = [
+            subprocess.Popen(
+                [sys.executable, "manage.py", "runserver", f"127.0.0.1:{wsgi_port}", "--noreload"],
+                cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ),
+            subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "config.asgi:application",
+                 "--port", str(asgi_port), "--log-level", "warning"],
+                cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ),
+        ]
+
+        results = []
+        try:
+            wait_for_port(wsgi_port)
+            wait_for_port(asgi_port)
+            for label, wsgi_path, asgi_path in ENDPOINTS:
+                wsgi = run_load(wsgi_port, wsgi_path, token.key, options["concurrency"], options["duration"])
+                asgi = run_load(asgi_port, asgi_path, token.key, options["concurrency"], options["duration"])
+                results.append({"endpoint": label, "wsgi": wsgi, "asgi": asgi})
+                self.stdout.write(
+                    f"{label:<12} wsgi {wsgi['rps']:>8} req/s ({wsgi['errors']} errors)   "
+                    f"asgi {asgi['rps']:>8} req/s ({asgi['errors']} errors)"
+                )
+        finally:
+            for server in servers:
+                server.terminate()
+                server.wait()
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"concurrency": options["concurrency"], "duration": options["duration"],
+                           "results": results}, f, indent=2)
@@ -0,0 +1,245 @@
+import json
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from app import urls as app_urls
+from app.models import Dream
+
+DUMMY_CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Context:
+    """Sample objects the scenarios build their requests from."""
+
+    def __init__(self, user, password):
+        self.user = user
+        self.password = password
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.own_dream = Dream.objects.filter(user=user).order_by("-created_at").first()
+        self.public_dream = Dream.objects.filter(is_public=True).exclude(user=user).order_by("-created_at").first()
+        if self.own_dream is None or self.public_dream is None:
+            raise CommandError("The benchmark user needs dreams and other users need public dreams, run seed_dreams")
+        self.search_term = (self.own_dream.title.split() or ["dream"])[-1]
+
+    @property
+    def staff_token(self):
+        if not hasattr(self, "_staff_token"):
+            staff = User.objects.create_user(username=f"bench_staff_{uuid.uuid4().hex[:8]}", is_staff=True)
+            self._staff_token = Token.objects.create(user=staff).key
+        return self._staff_token
+
+    def throwaway_dream(self):
+        return Dream.objects.create(user=self.user, title="Benchmark", content="To be deleted")
+
+    def throwaway_token(self):
+        other = User.objects.create_user(username=f"bench_{uuid.uuid4().hex[:12]}")
+        return Token.objects.create(user=other).key
+
+
+# Each scenario returns the request to time for iteration i; anything it
+# creates beforehand is set up outside the timer. Keyed by route in app/urls.py.
+SCENARIOS = {
+    "analytics/": lambda ctx, i: {"method": "get", "path": "/app/analytics/"},
+    "auth/login/": lambda ctx, i: {
+        "method": "post", "path": "/app/auth/login/",
+        "data": {"email": ctx.user.email, "password": ctx.password}, "auth": False,
+    },
+    "auth/register/": lambda ctx, i: {
+        "method": "post", "path": "/app/auth/register/", "auth": False,
+        "data": {"username": f"bench_{uuid.uuid4().hex[:12]}", "email": f"{uuid.uuid4().hex[:12]}@example.com",
+                 "password": "benchmark-password"},
+    },
+    "auth/me/": lambda ctx, i: {"method": "get", "path": "/app/auth/me/"},
+    "auth/logout/": lambda ctx, i: {"method": "post", "path": "/app/auth/logout/", "token": ctx.throwaway_token()},
+    "metrics/": lambda ctx, i: {"method": "get", "path": "/app/metrics/", "token": ctx.staff_token},
+    "dreams/public/": lambda ctx, i: {"method": "get", "path": "/app/dreams/public/"},
+    "dreams/older/": lambda ctx, i: {"method": "get", "path": "/app/dreams/older/"},
+    "dreams/trending/": lambda ctx, i: {"method": "get", "path": "/app/dreams/trending/?window=day"},
+    "dreams/search/": lambda ctx, i: {"method": "get", "path": f"/app/dreams/search/?q={ctx.search_term}&scope=public"},
+    "dreams/export/": lambda ctx, i: {"method": "get", "path": "/app/dreams/export/"},
+    "dreams/import/": lambda ctx, i: {
+        "method": "post", "path": "/app/dreams/import/", "content_type": "application/x-ndjson",
+        "data": "".join(json.dumps({"title": f"Imported {n}", "content": "...", "tags": ["bench"]}) + "\n"
+                        for n in range(10)),
+    },
+    "dreams/reactions/": lambda ctx, i: {
+        "method": "get", "path": f"/app/dreams/reactions/?ids={ctx.public_dream.id},{ctx.own_dream.id}",
+    },
+    "dreams/batch/": lambda ctx, i: {
+        "method": "post", "path": "/app/dreams/batch/",
+        "data": {"operations": [
+            *({"op": "create", "data": {"title": f"Batch {n}", "content": "...", "tags": ["bench"]}} for n in range(5)),
+            {"op": "update", "id": str(ctx.own_dream.id), "data": {"mood": ["Happy", "Sad"][i % 2]}},
+            {"op": "delete", "id": str(ctx.throwaway_dream().id)},
+        ]},
+    },
+    "dreams/": lambda ctx, i: {"method": "get", "path": "/app/dreams/"},
+    "dreams/<str:pk>/": lambda ctx, i: (
+        {"method": "put", "path": f"/app/dreams/{ctx.own_dream.id}/", "data": {"mood": ["Happy", "Sad"][i % 2]}}
+        if i % 2 else
+        {"method": "delete", "path": f"/app/dreams/{ctx.throwaway_dream().id}/"}
+    ),
+    "dreams/<uuid:id>/react/": lambda ctx, i: {"method": "post", "path": f"/app/dreams/{ctx.public_dream.id}/react/"},
+    "dreams/<uuid:id>/similar/": lambda ctx, i: {"method": "get", "path": f"/app/dreams/{ctx.public_dream.id}/similar/"},
+    "auth/profile/": lambda ctx, i: {"method": "get", "path": "/app/auth/profile/"},
+    "async/analytics/": lambda ctx, i: {"method": "get", "path": "/app/async/analytics/"},
+    "async/dreams/public/": lambda ctx, i: {"method": "get", "path": "/app/async/dreams/public/"},
+    "async/dreams/": lambda ctx, i: {"method": "get", "path": "/app/async/dreams/"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every URL in app/urls.py through the test client and record latency percentiles and "
+        "query counts. All writes are rolled back. Fails if a baseline is given and an endpoint regressed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Username to benchmark as (default: the user with most dreams)")
+        parser.add_argument("--password", default="dreamcatcher", help="Password of that user, for auth/login/")
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--only", action="append", help="Only run routes containing this text (repeatable)")
+        parser.add_argument("--with-cache", action="store_true",
+                            help="Keep the response cache enabled (by default every request does the full work)")
+        parser.add_argument("--output", default="bench_endpoints.json", help="Where to write the results")
+        parser.add_argument("--baseline", help="Results file of an earlier run to compare against")
+        parser.add_argument("--threshold", type=float, default=20.0,
+                            help="Allowed p95 latency increase over the baseline, in percent")
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+        else:
+            user = User.objects.annotate(dream_count=Count("dreams")).order_by("-dream_count").first()
+        if user is None:
+            raise CommandError("No user to benchmark as, run seed_dreams first")
+
+        routes = [str(p.pattern) for p in app_urls.urlpatterns]
+        missing = [r for r in routes if r not in SCENARIOS]
+        for route in missing:
+            self.stderr.write(f"No benchmark scenario for {route}, skipped")
+        if options["only"]:
+            routes = [r for r in routes if any(o in r for o in options["only"])]
+
+        results = {}
+        try:
+            with transaction.atomic():
+                ctx = Context(user, options["password"])
+                if options["with_cache"]:
+                    results = self.run_all(ctx, routes, options)
+                else:
+                    with override_settings(CACHES=DUMMY_CACHES):
+                        results = self.run_all(ctx, routes, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if options["baseline"]:
+            self.compare(results, options["baseline"], options["threshold"])
+
+    def run_all(self, ctx, routes, options):
+        results = {}
+        for route in routes:
+            if route not in SCENARIOS:
+                continue
+            results[route] = self.run_scenario(ctx, SCENARIOS[route], options)
+            r = results[route]
+            self.stdout.write(
+                f"{r['method'].upper():<10} {route:<26} p50 {r['p50_ms']:>8.2f}ms  p95 {r['p95_ms']:>8.2f}ms  "
+                f"p99 {r['p99_ms']:>8.2f}ms  queries {r['queries']:>3}  status {r['status']}"
+            )
+        return results
+
+    def run_scenario(self, ctx, scenario, options):
+        client = Client()
+        timings = []
+        queries = []
+        statuses = set()
+        methods = []
+        request = None
+
+        for i in range(options["warmup"] + options["iterations"]):
+            request = scenario(ctx, i)
+            if request["method"] not in methods:
+                methods.append(request["method"])
+            kwargs = {}
+            if request.get("auth", True):
+                kwargs["HTTP_AUTHORIZATION"] = f"Token {request.get('token', ctx.token)}"
+            data = request.get("data")
+            content_type = request.get("content_type", "application/json")
+            if data is not None and content_type == "application/json":
+                data = json.dumps(data)
+
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if request["method"] == "get":
+                    response = client.get(request["path"], **kwargs)
+                else:
+                    response = client.generic(request["method"].upper(), request["path"], data or "",
+                                              content_type=content_type, **kwargs)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                elapsed = (time.perf_counter() - started) * 1000
+
+            if i >= options["warmup"]:
+                timings.append(elapsed)
+                queries.append(len(captured.captured_queries))
+                statuses.add(response.status_code)
+
+        timings.sort()
+        return {
+            "method": "/".join(methods),
+            "path": request["path"],
+            "iterations": len(timings),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "mean_ms": round(sum(timings) / len(timings), 3) if timings else 0.0,
+            "queries": max(queries) if queries else 0,
+            "status": sorted(statuses),
+        }
+
+    def compare(self, results, baseline_path, threshold):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for route, current in results.items():
+            previous = baseline.get(route)
+            if previous is None:
+                continue
+            if current["queries"] > previous["queries"]:
+                regressions.append(f"{route}: {previous['queries']} -> {current['queries']} queries")
+            limit = previous["p95_ms"] * (1 + threshold / 100)
+            if current["p95_ms"] > limit:
+                regressions.append(f"{route}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+
+        if regressions:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}"))
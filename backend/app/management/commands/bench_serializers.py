@@ -0,0 +1,83 @@
+import json
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from app.models import Dream, Profile
+from app.projections import DREAMS, PUBLIC_DREAMS
+from app.serializers import DreamSerializer, PublicDreamSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+def best_of(repeat, func):
+    # Best wall time in ms over `repeat` runs, and the last result
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DreamSerializer/PublicDreamSerializer with the .values() projections in app/projections.py "
+        "on lists of 1k, 10k and 100k dreams. The rows are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        results = []
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username=f"bench_serializers_{time.time_ns()}")
+                Profile.objects.create(user=user, full_name="Benchmark", bio="...")
+                created = 0
+                now = timezone.now()
+                for rows in sorted(options["rows"]):
+                    Dream.objects.bulk_create(
+                        [Dream(user=user, title=f"Dream {i}", content="word " * 60, mood="Happy",
+                               tags=["flying", "sea"], created_at=now - timedelta(seconds=i))
+                         for i in range(created, rows)],
+                        batch_size=2000,
+                    )
+                    created = rows
+                    dreams = Dream.objects.filter(user=user).order_by("-created_at")[:rows]
+                    for label, slow, fast in [
+                        ("dreams", lambda: DreamSerializer(dreams, many=True).data, lambda: DREAMS.serialize(dreams)),
+                        ("public", lambda: PublicDreamSerializer(dreams.select_related("user__profile"), many=True).data,
+                         lambda: PUBLIC_DREAMS.serialize(dreams)),
+                    ]:
+                        slow_ms, slow_data = best_of(options["repeat"], slow)
+                        fast_ms, fast_data = best_of(options["repeat"], fast)
+                        # The two paths must agree, or the timing means nothing
+                        if json.dumps(slow_data, default=str) != json.dumps(fast_data, default=str):
+                            raise AssertionError(f"{label}: projection output differs from the serializer")
+                        results.append({
+                            "endpoint": label, "rows": rows, "serializer_ms": round(slow_ms, 1),
+                            "projection_ms": round(fast_ms, 1), "speedup": round(slow_ms / fast_ms, 2),
+                        })
+                        r = results[-1]
+                        self.stdout.write(
+                            f"{label:<7} {rows:>7} rows  serializer {r['serializer_ms']:>9.1f}ms  "
+                            f"projection {r['projection_ms']:>8.1f}ms  x{r['speedup']}"
+                        )
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"repeat": options["repeat"], "results": results}, f, indent=2)
@@ -0,0 +1,159 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# SQLite's own defaults, i.e. what a plain sqlite3 DATABASES entry gets
+DEFAULT_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+SCHEMA = [
+    """CREATE TABLE dream (
+        id TEXT PRIMARY KEY, user_id INTEGER, title TEXT, content TEXT,
+        is_public INTEGER, heart_count INTEGER NOT NULL DEFAULT 0, created_at REAL
+    )""",
+    "CREATE INDEX dream_public_feed ON dream (is_public, created_at DESC, id DESC)",
+    """CREATE TABLE reaction (
+        dream_id TEXT, user_id INTEGER, UNIQUE (dream_id, user_id)
+    )""",
+]
+
+
+def create_database(path, dreams, users):
+    conn = sqlite3.connect(path)
+    for sql in SCHEMA:
+        conn.execute(sql)
+    rng = random.Random(1)
+    now = time.time()
+    conn.executemany(
+        "INSERT INTO dream VALUES (?, ?, ?, ?, ?, 0, ?)",
+        [(uuid.uuid4().hex, rng.randint(1, users), "Dream", "word " * 200, 1, now - rng.random() * 86400 * 365)
+         for _ in range(dreams)],
+    )
+    conn.commit()
+    ids = [row[0] for row in conn.execute("SELECT id FROM dream ORDER BY created_at DESC LIMIT 200")]
+    conn.close()
+    return ids
+
+
+def connect(path, pragmas):
+    # Same connection setup as app.signals.configure_sqlite; without a
+    # busy_timeout Python's default 5 second timeout applies, as in Django
+    timeout = pragmas.get("busy_timeout", 5000) / 1000
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def run_workload(path, pragmas, immediate, readers, writers, duration, hot_ids, users):
+    begin_sql = "BEGIN IMMEDIATE" if immediate else "BEGIN"
+    counts = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def add(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        conn = connect(path, pragmas)
+        while time.monotonic() < deadline:
+            try:
+                conn.execute(
+                    "SELECT id, title, content, heart_count FROM dream WHERE is_public = 1 "
+                    "ORDER BY created_at DESC, id DESC LIMIT 20"
+                ).fetchall()
+                add("reads")
+            except sqlite3.OperationalError:
+                add("locked")
+        conn.close()
+
+    def writer(seed):
+        rng = random.Random(seed)
+        conn = connect(path, pragmas)
+        while time.monotonic() < deadline:
+            dream_id = rng.choice(hot_ids)
+            user_id = rng.randint(1, users)
+            try:
+                # Same shape as app.reactions.toggle_heart
+                conn.execute(begin_sql)
+                deleted = conn.execute(
+                    "DELETE FROM reaction WHERE dream_id = ? AND user_id = ?", (dream_id, user_id)
+                ).rowcount
+                if deleted:
+                    conn.execute("UPDATE dream SET heart_count = heart_count - 1 WHERE id = ?", (dream_id,))
+                else:
+                    conn.execute("INSERT OR IGNORE INTO reaction VALUES (?, ?)", (dream_id, user_id))
+                    conn.execute("UPDATE dream SET heart_count = heart_count + 1 WHERE id = ?", (dream_id,))
+                conn.execute("COMMIT")
+                add("writes")
+            except sqlite3.OperationalError:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                add("locked")
+        conn.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    return {
+        "reads_per_second": round(counts["reads"] / elapsed, 1),
+        "writes_per_second": round(counts["writes"] / elapsed, 1),
+        "locked_errors": counts["locked"],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure mixed read/write throughput on a scratch SQLite file with SQLite's default "
+        "configuration and with the SQLITE_PRAGMAS from settings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dreams", type=int, default=20000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per configuration")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        tuned = dict(getattr(settings, "SQLITE_PRAGMAS", {}))
+        immediate = settings.DATABASES["default"].get("OPTIONS", {}).get("transaction_mode") == "IMMEDIATE"
+        configurations = [
+            ("default", DEFAULT_PRAGMAS, False),
+            ("tuned", tuned, immediate),
+        ]
+
+        results = {}
+        for label, pragmas, use_immediate in configurations:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "bench.sqlite3")
+                hot_ids = create_database(path, options["dreams"], options["users"])
+                results[label] = run_workload(
+                    path, pragmas, use_immediate, options["readers"], options["writers"],
+                    options["duration"], hot_ids, options["users"],
+                )
+            r = results[label]
+            self.stdout.write(
+                f"{label:<8} reads {r['reads_per_second']:>10}/s  writes {r['writes_per_second']:>8}/s  "
+                f"locked errors {r['locked_errors']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"options": {k: options[k] for k in ("dreams", "readers", "writers", "duration")},
+                           "pragmas": tuned, "results": results}, f, indent=2)
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import jobs, similar
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the similar dreams index (see app/similar.py) from every public dream and make it the "
+        "current one. Changes made since the previous build are folded in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--defer", action="store_true", help="Queue the build for run_jobs instead")
+
+    def handle(self, *args, **options):
+        if options["defer"]:
+            jobs.enqueue("similar.build", dedupe_key="similar.build")
+            self.stdout.write(self.style.SUCCESS("Queued the similar dreams index build"))
+            return
+        started = time.perf_counter()
+        try:
+            manifest = similar.build(batch_size=options["batch_size"])
+        except similar.SimilarityUnavailable as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Built similar dreams index {manifest['build']}: {manifest['documents']} dream(s), "
+            f"{manifest['nnz']} weights in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from app import cache, jobs, trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete trending counter buckets that fell out of their window (see app/trending.py). "
+        "Run it periodically, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Recompute all buckets from the public dreams of the last week instead")
+        parser.add_argument("--defer", action="store_true", help="Queue the compaction for run_jobs instead")
+
+    def handle(self, *args, **options):
+        if options["defer"]:
+            jobs.enqueue("trending.compact", dedupe_key="trending.compact")
+            self.stdout.write(self.style.SUCCESS("Queued trending compaction"))
+            return
+        if options["rebuild"]:
+            trending.rebuild()
+            cache.bump_public()
+            self.stdout.write(self.style.SUCCESS("Rebuilt the trending counters"))
+            return
+        deleted = trending.compact()
+        self.stdout.write(self.style.SUCCESS(f"Compacted trending counters, {deleted} expired bucket row(s) deleted"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from app import jobs
+from app.analytics import rebuild_daily_stats
+from app.models import UserDailyStats
+
+
+class Command(BaseCommand):
+    help = "Backfill the UserDailyStats rollup from the Dream table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users",
+                            help="Only rebuild these user ids (repeatable)")
+        parser.add_argument("--defer", action="store_true", help="Queue it for run_jobs instead")
+
+    def handle(self, *args, **options):
+        if options["defer"]:
+            users = options["users"]
+            jobs.enqueue("analytics.rebuild_daily_stats", users,
+                         dedupe_key=None if users else "analytics.rebuild_daily_stats")
+            self.stdout.write(self.style.SUCCESS("Queued the daily stats rebuild"))
+            return
+        rebuild_daily_stats(user_ids=options["users"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt daily stats, {UserDailyStats.objects.count()} row(s)"
+        ))
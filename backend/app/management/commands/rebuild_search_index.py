@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over dream titles and content"
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError("Search requires SQLite FTS5")
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the dream search index"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app import jobs
+from app.reactions import reconcile_heart_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute Dream.heart_count from DreamReaction rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--defer", action="store_true", help="Queue it for run_jobs instead")
+
+    def handle(self, *args, **options):
+        if options["defer"]:
+            jobs.enqueue("reactions.reconcile", dedupe_key="reactions.reconcile")
+            self.stdout.write(self.style.SUCCESS("Queued heart count reconciliation"))
+            return
+        fixed = reconcile_heart_counts(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled heart counts, {fixed} dream(s) corrected"))
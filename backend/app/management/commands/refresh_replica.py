@@ -0,0 +1,55 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from app.routers import mark_refreshed, replica_alias
+
+
+def copy_database(source_path, replica_path, timeout):
+    # The backup API takes a consistent snapshot while the primary keeps
+    # serving writes, and replaces the replica's pages in one transaction so
+    # its readers see either the old or the new copy
+    source = sqlite3.connect(source_path, timeout=timeout)
+    replica = sqlite3.connect(replica_path, timeout=timeout)
+    try:
+        source.backup(replica)
+    finally:
+        replica.close()
+        source.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database to the read replica configured with SQLITE_REPLICA_PATH, "
+        "once or every --interval seconds"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, help="Keep refreshing, waiting this many seconds in between")
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError("No replica configured, set SQLITE_REPLICA_PATH")
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replica = settings.DATABASES[alias]
+        if primary["ENGINE"] != "django.db.backends.sqlite3" or replica["ENGINE"] != primary["ENGINE"]:
+            raise CommandError("refresh_replica only copies SQLite databases")
+        if str(primary["NAME"]) == str(replica["NAME"]):
+            raise CommandError("The replica must be a different file than the primary")
+
+        timeout = primary.get("OPTIONS", {}).get("timeout", 5)
+        while True:
+            started = time.monotonic()
+            started_at = timezone.now()
+            copy_database(str(primary["NAME"]), str(replica["NAME"]), timeout)
+            # Unpins users whose writes the copy includes
+            mark_refreshed(started_at)
+            self.stdout.write(f"Refreshed {replica['NAME']} in {time.monotonic() - started:.2f}s")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
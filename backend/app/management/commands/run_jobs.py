@@ -0,0 +1,111 @@
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from app import jobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (see app/jobs.py and app/tasks.py) until stopped. "
+        "Failed jobs are retried with exponential backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=1, help="Worker threads or processes")
+        parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--batch-size", type=int, default=10, help="Jobs claimed at a time by each worker")
+        parser.add_argument("--once", action="store_true", help="Exit when no job is due instead of waiting")
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self.request_stop)
+
+        if options["mode"] == "process" and options["concurrency"] > 1:
+            self.run_processes(options)
+        else:
+            self.run_threads(options)
+
+    def request_stop(self, signum, frame):
+        # Let running jobs finish, then exit
+        self.stop.set()
+
+    def run_threads(self, options):
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        if options["concurrency"] == 1:
+            self.work_loop(f"{prefix}:0", options)
+            self.stdout.write("Job worker stopped")
+            return
+
+        threads = [
+            threading.Thread(target=self.work_loop, args=(f"{prefix}:{i}", options), name=f"job-worker-{i}")
+            for i in range(options["concurrency"])
+        ]
+        for t in threads:
+            t.start()
+        # Join with a timeout so signals still reach the main thread
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(0.5)
+        self.stdout.write("Job workers stopped")
+
+    def work_loop(self, worker_id, options):
+        lock_timeout = getattr(settings, "DREAM_JOB_LOCK_TIMEOUT", 600)
+        last_stale_check = 0.0
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                try:
+                    if time.monotonic() - last_stale_check > lock_timeout / 2:
+                        jobs.requeue_stale()
+                        last_stale_check = time.monotonic()
+                    if jobs.work(worker_id, options["batch_size"]):
+                        continue
+                except Exception:
+                    # e.g. "database is locked" past busy_timeout; a worker
+                    # that died here would leave the queue piling up
+                    logger.exception("Job worker %s failed, retrying", worker_id)
+                    close_old_connections()
+                    self.stop.wait(options["poll_interval"])
+                    continue
+                if options["once"]:
+                    break
+                self.stop.wait(options["poll_interval"])
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
+    def run_processes(self, options):
+        # Each child is a single-threaded worker with its own interpreter
+        command = [
+            sys.executable, "manage.py", "run_jobs", "--mode", "thread", "--concurrency", "1",
+            "--poll-interval", str(options["poll_interval"]), "--batch-size", str(options["batch_size"]),
+        ]
+        if options["once"]:
+            command.append("--once")
+        children = [subprocess.Popen(command, cwd=settings.BASE_DIR) for _ in range(options["concurrency"])]
+        try:
+            while any(child.poll() is None for child in children):
+                if self.stop.is_set():
+                    for child in children:
+                        if child.poll() is None:
+                            child.send_signal(signal.SIGTERM)
+                    break
+                time.sleep(0.5)
+        finally:
+            for child in children:
+                child.wait()
+        self.stdout.write("Job workers stopped")
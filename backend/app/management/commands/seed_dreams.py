@@ -0,0 +1,115 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from app import cache, trending
+from app.analytics import rebuild_daily_stats
+from app.models import Dream, DreamReaction, Profile
+from app.tags import sync_dream_tags
+
+# Same choices as the mood picker in the frontend
+MOODS = ["Peaceful", "Exciting", "Scary", "Confusing", "Happy", "Sad", "Mysterious", "Anxious"]
+
+TAGS = [
+    "flying", "falling", "water", "ocean", "chase", "school", "exam", "family", "house", "forest",
+    "animals", "lucid", "nightmare", "teeth", "travel", "city", "childhood", "friends", "work", "late",
+    "lost", "stairs", "space", "stars", "mountains", "snow", "fire", "dog", "cat", "music",
+]
+
+WORDS = [
+    "I", "was", "running", "through", "a", "long", "corridor", "that", "never", "ended", "and", "the",
+    "walls", "were", "made", "of", "water", "suddenly", "my", "old", "teacher", "appeared", "holding",
+    "a", "lantern", "we", "flew", "over", "the", "city", "at", "night", "everything", "felt", "strange",
+    "then", "the", "floor", "disappeared", "beneath", "me", "I", "could", "hear", "music", "in", "the",
+    "distance", "forest", "ocean", "door", "mirror", "train", "house", "stairs", "sky", "stars",
+]
+
+TITLES = [
+    "Endless corridor", "Flying over the city", "Lost in the forest", "The exam I forgot",
+    "Ocean of stars", "Falling stairs", "Back at my childhood house", "The talking cat",
+    "Missed the train", "Snow in summer", "Lantern in the dark", "Mirror world",
+]
+
+
+class Command(BaseCommand):
+    help = "Seed synthetic users, profiles, dreams and reactions for local performance testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--dreams", type=int, default=50, help="Dreams per user on average")
+        parser.add_argument("--reactions", type=int, default=10, help="Reactions per public dream on average")
+        parser.add_argument("--days", type=int, default=365, help="Spread dreams over this many days")
+        parser.add_argument("--public-ratio", type=float, default=0.6)
+        parser.add_argument("--password", default="dreamcatcher", help="Password of every seeded user")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible data")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        now = timezone.now()
+
+        # Hashing is slow on purpose, every seeded user shares one hash
+        password = make_password(options["password"])
+        prefix = f"seed{uuid.uuid4().hex[:6]}"
+        User.objects.bulk_create(
+            [User(username=f"{prefix}_{i}", email=f"{prefix}_{i}@example.com", password=password)
+             for i in range(options["users"])],
+            batch_size=batch_size,
+        )
+        # Reload, bulk_create only returns primary keys on some backends
+        users = list(User.objects.filter(username__startswith=f"{prefix}_").order_by("id"))
+        Profile.objects.bulk_create(
+            [Profile(user=u, full_name=f"Dreamer {i}", bio="Seeded for benchmarks") for i, u in enumerate(users)],
+            batch_size=batch_size,
+        )
+
+        dreams = []
+        for user in users:
+            for _ in range(max(0, int(rng.expovariate(1 / options["dreams"])))):
+                dreams.append(Dream(
+                    user=user,
+                    title=rng.choice(TITLES),
+                    content=" ".join(rng.choices(WORDS, k=rng.randint(40, 400))),
+                    mood=rng.choice(MOODS + [None]),
+                    # A few tags are far more popular than the rest
+                    tags=list(dict.fromkeys(rng.choices(TAGS, weights=[1 / (i + 1) for i in range(len(TAGS))],
+                                                        k=rng.randint(0, 4)))),
+                    is_public=rng.random() < options["public_ratio"],
+                ))
+
+        public = [d for d in dreams if d.is_public]
+        reactions = []
+        if public and users:
+            for dream in public:
+                likers = rng.sample(users, min(len(users), int(rng.expovariate(1 / max(options["reactions"], 1)))))
+                dream.heart_count = len(likers)
+                reactions.extend(DreamReaction(dream=dream, user=u) for u in likers)
+
+        for start in range(0, len(dreams), batch_size):
+            batch = dreams[start:start + batch_size]
+            with transaction.atomic():
+                Dream.objects.bulk_create(batch)
+                # created_at is auto_now_add, spread it out afterwards
+                for dream in batch:
+                    dream.created_at = now - timedelta(seconds=rng.randint(0, options["days"] * 86400))
+                Dream.objects.bulk_update(batch, ["created_at"])
+                sync_dream_tags(batch)
+
+        DreamReaction.objects.bulk_create(reactions, batch_size=batch_size)
+        user_ids = [u.id for u in users]
+        for start in range(0, len(user_ids), 500):
+            rebuild_daily_stats(user_ids=user_ids[start:start + 500])
+        trending.rebuild()
+        cache.bump_public()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(dreams)} dreams ({len(public)} public) "
+            f"and {len(reactions)} reactions, password '{options['password']}'"
+        ))
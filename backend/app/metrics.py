@@ -0,0 +1,96 @@
+import threading
+from bisect import bisect_left
+
+from . import cache
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """In-process per-view histograms, exported in Prometheus text format."""
+
+    SERIES = (
+        ("dream_request_duration_seconds", "Wall time of the request", SECONDS_BUCKETS),
+        ("dream_request_db_seconds", "Time spent in database queries", SECONDS_BUCKETS),
+        ("dream_request_render_seconds", "Time spent rendering the response body", SECONDS_BUCKETS),
+        ("dream_request_queries", "Database queries per request", QUERY_BUCKETS),
+        ("dream_response_size_bytes", "Response body size", BYTES_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._responses = {}
+
+    def observe(self, view, status, duration, db, render, queries, size):
+        values = (duration, db, render, queries, size)
+        with self._lock:
+            histograms = self._histograms.get(view)
+            if histograms is None:
+                histograms = self._histograms[view] = [Histogram(b) for _, _, b in self.SERIES]
+            for histogram, value in zip(histograms, values):
+                if value is not None:
+                    histogram.observe(value)
+            key = (view, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._responses.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append("# HELP dream_responses_total Responses by view and status code")
+            lines.append("# TYPE dream_responses_total counter")
+            for (view, status), count in sorted(self._responses.items()):
+                lines.append(f'dream_responses_total{{view="{_escape(view)}",status="{status}"}} {count}')
+
+            for index, (name, help_text, buckets) in enumerate(self.SERIES):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for view, histograms in sorted(self._histograms.items()):
+                    histogram = histograms[index]
+                    label = f'view="{_escape(view)}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+        cache_stats = cache.stats()
+        lines.append("# HELP dream_cache_requests_total Response cache lookups by namespace and outcome")
+        lines.append("# TYPE dream_cache_requests_total counter")
+        for namespace, counters in sorted(cache_stats.items()):
+            for outcome in ("hits", "misses"):
+                lines.append(
+                    f'dream_cache_requests_total{{namespace="{_escape(namespace)}",outcome="{outcome[:-1]}"}} '
+                    f'{counters[outcome]}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = RequestMetrics()
@@ -0,0 +1,156 @@
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from . import compression
+from .metrics import registry
+
+
+class QueryTimer:
+    """connection.execute_wrapper that counts queries and their total time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class InstrumentationMiddleware:
+    """
+    Measure wall time, database time, query count, render time and response
+    size per resolved URL name. Sent back as a Server-Timing header and
+    aggregated into app.metrics for the metrics endpoint. Removed from the
+    stack entirely unless DREAM_INSTRUMENTATION is on.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "DREAM_INSTRUMENTATION", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        request._render_seconds = None
+        started = time.perf_counter()
+        with self.timed_queries(timer):
+            response = self.get_response(request)
+        return self.finish(request, response, timer, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        request._render_seconds = None
+        started = time.perf_counter()
+        # Connections are per thread, so wrap the ones of the thread the
+        # request's sync_to_async code, and with it every query, runs in
+        stack = await sync_to_async(self.timed_queries)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, timer, time.perf_counter() - started)
+
+    def timed_queries(self, timer):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+        return stack
+
+    def finish(self, request, response, timer, duration):
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name or match.route) if match else "unresolved"
+        size = None if response.streaming else len(response.content)
+        render = request._render_seconds
+
+        registry.observe(view, response.status_code, duration, timer.seconds, render, timer.count, size)
+
+        timings = [
+            f"total;dur={duration * 1000:.2f}",
+            f'db;dur={timer.seconds * 1000:.2f};desc="{timer.count} queries"',
+        ]
+        if render is not None:
+            timings.append(f"render;dur={render * 1000:.2f}")
+        response["Server-Timing"] = ", ".join(timings)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._render_seconds = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class CompressionMiddleware:
+    """
+    gzip, or brotli when installed, for text and JSON responses the client
+    accepts it for and that are at least DREAM_COMPRESSION_MIN_SIZE bytes.
+    Streaming responses are compressed chunk by chunk and stay streamed.
+    Bodies a view already encoded (see PublicDreamsView) pass through.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "DREAM_COMPRESSION", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding") or not compression.is_compressible(response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = compression.negotiate(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.acompress_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compression.compress_stream(response.streaming_content, encoding)
+            del response["Content-Length"]
+            compression.mark_encoded(response, encoding)
+            return response
+
+        if len(response.content) < compression.min_compressed_size():
+            return response
+        compressed = compression.compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        compression.mark_encoded(response, encoding, len(compressed))
+        return response
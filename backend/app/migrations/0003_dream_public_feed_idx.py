@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_dream_dreamreaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dream',
+            index=models.Index(fields=['is_public', '-created_at', '-id'], name='dream_public_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_heart_counts(apps, schema_editor):
+    Dream = apps.get_model('app', 'Dream')
+    DreamReaction = apps.get_model('app', 'DreamReaction')
+    counts = (DreamReaction.objects.filter(dream=OuterRef('pk'), reaction_type='heart')
+              .order_by()
+              .values('dream')
+              .annotate(count=Count('id'))
+              .values('count'))
+    Dream.objects.update(heart_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_dream_public_feed_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dream',
+            name='heart_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_heart_counts, migrations.RunPython.noop),
+    ]
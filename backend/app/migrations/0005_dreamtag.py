@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of app.tags.normalize_tags, migrations must not import app code
+def normalize_tags(tags):
+    if not isinstance(tags, list):
+        return []
+    seen = []
+    for tag in tags:
+        tag = str(tag).strip()[:100]
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def backfill_dream_tags(apps, schema_editor):
+    Dream = apps.get_model('app', 'Dream')
+    DreamTag = apps.get_model('app', 'DreamTag')
+    batch = []
+    for dream in Dream.objects.only('id', 'user_id', 'tags').iterator(chunk_size=2000):
+        batch.extend(DreamTag(dream_id=dream.id, user_id=dream.user_id, tag=tag) for tag in normalize_tags(dream.tags))
+        if len(batch) >= 2000:
+            DreamTag.objects.bulk_create(batch)
+            batch = []
+    DreamTag.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_dream_heart_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DreamTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100)),
+                ('dream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_index', to='app.dream')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dream_tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'tag'], name='dreamtag_user_tag_idx')],
+                'unique_together': {('dream', 'tag')},
+            },
+        ),
+        migrations.RunPython(backfill_dream_tags, migrations.RunPython.noop),
+    ]
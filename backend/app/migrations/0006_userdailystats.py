@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    Dream = apps.get_model('app', 'Dream')
+    UserDailyStats = apps.get_model('app', 'UserDailyStats')
+    rows = (Dream.objects.annotate(day=TruncDate('created_at'))
+            .values('user_id', 'day', 'mood')
+            .annotate(count=Count('id'))
+            .order_by())
+    UserDailyStats.objects.bulk_create(
+        [UserDailyStats(user_id=r['user_id'], day=r['day'], mood=r['mood'], count=r['count']) for r in rows],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_dreamtag'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('mood', models.CharField(blank=True, max_length=50, null=True)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'day', 'mood')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:47
+
+import datetime
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Frozen copies of app.trending's windows and counting, migrations must not
+# import app code. Window length -> bucket length in seconds.
+WINDOWS = [
+    (timedelta(hours=1), 300),
+    (timedelta(days=1), 3600),
+    (timedelta(days=7), 86400),
+]
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def bucket_start(moment, resolution):
+    seconds = int((moment - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def counted_values(tags, mood):
+    values = []
+    for tag in tags if isinstance(tags, list) else []:
+        tag = str(tag).strip()[:100]
+        if tag and ('tag', tag) not in values:
+            values.append(('tag', tag))
+    mood = (mood or '').strip()
+    if mood:
+        values.append(('mood', mood))
+    return values
+
+
+def backfill_trending(apps, schema_editor):
+    Dream = apps.get_model('app', 'Dream')
+    TrendingCounter = apps.get_model('app', 'TrendingCounter')
+    now = timezone.now()
+    longest = max(length for length, _ in WINDOWS)
+    deltas = {}
+    for created_at, tags, mood in (Dream.objects.filter(is_public=True, created_at__gt=now - longest)
+                                   .values_list('created_at', 'tags', 'mood')):
+        values = counted_values(tags, mood)
+        for length, resolution in WINDOWS:
+            start = bucket_start(created_at, resolution)
+            if start <= now - length:
+                continue
+            for kind, value in values:
+                key = (resolution, start, kind, value)
+                deltas[key] = deltas.get(key, 0) + 1
+    TrendingCounter.objects.bulk_create(
+        [TrendingCounter(resolution=r, bucket_start=s, kind=k, value=v, count=c)
+         for (r, s, k, v), c in deltas.items()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('value', models.CharField(max_length=100)),
+                ('resolution', models.PositiveIntegerField()),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('resolution', 'bucket_start', 'kind', 'value')},
+            },
+        ),
+        migrations.RunPython(backfill_trending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_trendingcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dreamreaction',
+            name='dream',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='reactions', to='app.dream'),
+        ),
+        migrations.AlterField(
+            model_name='dreamtag',
+            name='dream',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='tag_index', to='app.dream'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedDream',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('content', models.TextField()),
+                ('mood', models.CharField(blank=True, max_length=50, null=True)),
+                ('tags', models.JSONField(blank=True, default=list)),
+                ('is_public', models.BooleanField(default=True)),
+                ('heart_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_dreams', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='archived_user_idx'), models.Index(fields=['is_public', '-created_at', '-id'], name='archived_public_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_archiveddream'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarDreamVector',
+            fields=[
+                ('dream_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('features', models.BinaryField()),
+                ('weights', models.BinaryField()),
+                ('removed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    # unique_together let dreams without a mood get several rows per day
+    UserDailyStats = apps.get_model('app', 'UserDailyStats')
+    duplicates = (UserDailyStats.objects.filter(mood__isnull=True)
+                  .values('user_id', 'day')
+                  .annotate(rows=Count('id'), keep=Min('id'), total=Sum('count'))
+                  .filter(rows__gt=1))
+    for row in duplicates:
+        rows = UserDailyStats.objects.filter(user_id=row['user_id'], day=row['day'], mood__isnull=True)
+        rows.exclude(id=row['keep']).delete()
+        rows.filter(id=row['keep']).update(count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_similardreamvector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='userdailystats',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='userdailystats',
+            constraint=models.UniqueConstraint(condition=models.Q(('mood__isnull', False)), fields=('user', 'day', 'mood'), name='dailystats_user_day_mood'),
+        ),
+        migrations.AddConstraint(
+            model_name='userdailystats',
+            constraint=models.UniqueConstraint(condition=models.Q(('mood__isnull', True)), fields=('user', 'day'), name='dailystats_user_day_no_mood'),
+        ),
+    ]
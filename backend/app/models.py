@@ -23,13 +23,131 @@ class Dream(models.Model):
     tags = models.JSONField(default=list, blank=True)
     
     is_public = models.BooleanField(default=True)
+    # Denormalized count of heart reactions, see app.reactions
+    heart_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the public feed
+            models.Index(fields=['is_public', '-created_at', '-id'], name='dream_public_feed_idx'),
+        ]
+
+    # Fields app.signals compares against their stored values
+    TRACKED_FIELDS = ('is_public', 'tags', 'mood', 'title', 'content')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored state so signal handlers can tell what changed
+        instance._remember_loaded(dict(zip(field_names, values)))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_loaded(self.__dict__)
+
+    def _remember_loaded(self, values):
+        loaded = {name: values[name] for name in self.TRACKED_FIELDS if name in values}
+        # Copy the list, the instance's own can be changed in place
+        if isinstance(loaded.get('tags'), list):
+            loaded['tags'] = list(loaded['tags'])
+        self._loaded_values = loaded
+
+
+# Dreams moved out of the hot table by `manage.py archive_dreams`, see
+# app.archive. Read-only copies with the same ids and columns.
+class ArchivedDream(models.Model):
+    id = models.UUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_dreams')
+    title = models.CharField(max_length=255)
+    content = models.TextField()
+    mood = models.CharField(max_length=50, null=True, blank=True)
+    tags = models.JSONField(default=list, blank=True)
+    is_public = models.BooleanField(default=True)
+    heart_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the older listings
+            models.Index(fields=['user', '-created_at', '-id'], name='archived_user_idx'),
+            models.Index(fields=['is_public', '-created_at', '-id'], name='archived_public_idx'),
+        ]
+
+
+# Normalized index of Dream.tags, kept in sync by app.signals. Rows outlive
+# the archival of their dream, so the dream id is not a database constraint
+# and app.signals deletes them with the dream.
+class DreamTag(models.Model):
+    dream = models.ForeignKey(Dream, on_delete=models.DO_NOTHING, db_constraint=False, related_name='tag_index')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dream_tags')
+    tag = models.CharField(max_length=100)
+
+    class Meta:
+        unique_together = ('dream', 'tag')
+        indexes = [
+            models.Index(fields=['user', 'tag'], name='dreamtag_user_tag_idx'),
+        ]
+
+
+# Per-user daily dream counts by mood, maintained by app.signals
+class UserDailyStats(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    mood = models.CharField(max_length=50, null=True, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        # NULLs never collide in a unique index, so dreams without a mood
+        # get their own (user, day) constraint
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'mood'], condition=models.Q(mood__isnull=False),
+                name='dailystats_user_day_mood',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'day'], condition=models.Q(mood__isnull=True),
+                name='dailystats_user_day_no_mood',
+            ),
+        ]
+
+
+# Tag and mood counts of public dreams per time bucket, maintained by
+# app.signals and read by the trending endpoint, see app.trending
+class TrendingCounter(models.Model):
+    TAG = 'tag'
+    MOOD = 'mood'
+
+    kind = models.CharField(max_length=10)
+    value = models.CharField(max_length=100)
+    # Bucket length in seconds
+    resolution = models.PositiveIntegerField()
+    bucket_start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('resolution', 'bucket_start', 'kind', 'value')
+
+
+# Public dreams added, changed or removed since the similar dreams index
+# was last built, see app.similar. Folded into the next build.
+class SimilarDreamVector(models.Model):
+    dream_id = models.UUIDField(primary_key=True)
+    # Hashed terms (uint32) and their weights (float32), packed
+    features = models.BinaryField()
+    weights = models.BinaryField()
+    removed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
 
 # Dream Reaction model
 class DreamReaction(models.Model):
-    dream = models.ForeignKey(Dream, on_delete=models.CASCADE, related_name='reactions')
+    # Kept for archived dreams too, like DreamTag
+    dream = models.ForeignKey(Dream, on_delete=models.DO_NOTHING, db_constraint=False, related_name='reactions')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     reaction_type = models.CharField(max_length=20, default='heart')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -37,3 +155,49 @@ class DreamReaction(models.Model):
     class Meta:
         # Ensures a user can only like a dream once
         unique_together = ('dream', 'user', 'reaction_type')
+
+
+# Deferred work run by `manage.py run_jobs`, see app.jobs
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # At most one queued job per key, enqueueing a duplicate is a no-op
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=20, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=models.Q(status='queued'), name='job_queued_dedupe_key'
+            ),
+        ]
+
+
+# Read replica bookkeeping, see app.routers. Both live on the primary.
+# A user whose last write is newer than the last refresh of the replica
+# reads from the primary.
+class ReplicaPin(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    written_at = models.DateTimeField()
+
+
+# Single row, when the last copy to the replica started. Everything
+# committed before then is on the replica.
+class ReplicaRefresh(models.Model):
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    started_at = models.DateTimeField()
@@ -0,0 +1,94 @@
+import base64
+import json
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+# Encode the position of the last row of a page into an opaque cursor
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list):
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def get_page_size(request):
+    default = getattr(settings, "DREAM_FEED_PAGE_SIZE", 20)
+    maximum = getattr(settings, "DREAM_FEED_MAX_PAGE_SIZE", 100)
+    try:
+        size = int(request.query_params.get("page_size", default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+class KeysetPaginator:
+    """
+    Keyset pagination on (created_at, id), newest first.
+
+    Each page is a range scan that starts right after the last row of the
+    previous page, so the cost of a page does not depend on how deep it is.
+    """
+
+    def __init__(self, request):
+        self.page_size = get_page_size(request)
+        self.cursor = request.query_params.get("cursor")
+
+    def page_queryset(self, queryset):
+        queryset = queryset.order_by("-created_at", "-id")
+        if self.cursor:
+            values = decode_cursor(self.cursor)
+            if len(values) != 2:
+                raise InvalidCursor("Invalid cursor")
+            try:
+                created_at = parse_datetime(values[0])
+                last_id = uuid.UUID(str(values[1]))
+            except (TypeError, ValueError):
+                raise InvalidCursor("Invalid cursor")
+            if created_at is None:
+                raise InvalidCursor("Invalid cursor")
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=last_id)
+            )
+        # Fetch one extra row to know whether there is a next page
+        return queryset[:self.page_size + 1]
+
+    def split(self, rows):
+        rows = list(rows)
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        next_cursor = None
+        if has_next:
+            last = rows[-1]
+            # Model instances or .values() rows
+            if isinstance(last, dict):
+                created_at, last_id = last["created_at"], last["id"]
+            else:
+                created_at, last_id = last.created_at, last.id
+            next_cursor = encode_cursor([created_at.isoformat(), str(last_id)])
+        return rows, next_cursor
+
+    def paginate(self, queryset):
+        return self.split(self.page_queryset(queryset))
+
+    def get_response_data(self, results, next_cursor):
+        return {
+            "results": results,
+            "next": next_cursor,
+        }
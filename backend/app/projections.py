@@ -0,0 +1,188 @@
+import datetime
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+# Rows are always fetched with these, the feed paginates on them
+KEY_COLUMNS = ("id", "created_at")
+
+EXCERPT_SUFFIX = "\u2026"
+
+
+class InvalidFieldset(Exception):
+    pass
+
+
+def _output_timezone():
+    # What rest_framework.fields.DateTimeField.default_timezone() returns
+    return timezone.get_current_timezone() if settings.USE_TZ else None
+
+
+def _datetime(value, tz):
+    # rest_framework.fields.DateTimeField.to_representation for ISO 8601
+    if not value:
+        return None
+    if tz is not None:
+        value = value.astimezone(tz)
+    elif timezone.is_aware(value):
+        value = timezone.make_naive(value, datetime.timezone.utc)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+# One output key: the .values() columns it needs and how to build it
+Field = namedtuple("Field", ["name", "columns", "getter"])
+
+
+class Projection:
+    """
+    Read-only fast path for the list endpoints. Selects the columns of its
+    fields with .values() and builds each serialized dict from the row with
+    precompiled getters, instead of building a model instance and walking a
+    serializer's field tree per row. The full projection must produce
+    exactly what the matching serializer produces, see ProjectionTests; a
+    change to one of those serializers has to be made here as well.
+    """
+
+    def __init__(self, fields, annotations=None, excerpt=None):
+        self.fields = tuple(fields)
+        self.annotations = annotations or {}
+        self.excerpt = excerpt
+        columns = dict.fromkeys(KEY_COLUMNS)
+        for field in self.fields:
+            columns.update(dict.fromkeys(field.columns))
+        self.columns = tuple(columns)
+        getters = tuple((field.name, field.getter) for field in self.fields)
+        self.mapper = lambda row, tz: {name: getter(row, tz) for name, getter in getters}
+
+    @property
+    def names(self):
+        return [field.name for field in self.fields]
+
+    @property
+    def cache_key(self):
+        return [self.names, self.excerpt]
+
+    @lru_cache(maxsize=256)
+    def select(self, names=None, excerpt=None):
+        """
+        Projection of the named fields only, in this projection's order, with
+        content cut to `excerpt` characters by the database.
+        """
+        fields = [f for f in self.fields if names is None or f.name in names]
+        annotations = dict(self.annotations)
+        if excerpt is not None and any(f.name == "content" for f in fields):
+            # One character more than needed tells whether it was cut
+            annotations["content_excerpt"] = Substr("content", 1, excerpt + 1)
+
+            def content(row, tz):
+                text = row["content_excerpt"]
+                return text[:excerpt] + EXCERPT_SUFFIX if len(text) > excerpt else text
+
+            fields = [Field("content", ("content_excerpt",), content) if f.name == "content" else f
+                      for f in fields]
+        return Projection(fields, annotations, excerpt)
+
+    def from_params(self, params, required=()):
+        """
+        The projection asked for by ?fields=a,b,c and ?excerpt=N, raising
+        InvalidFieldset for unknown fields or a bad excerpt length. Fields
+        in `required` are added to any fieldset.
+        """
+        names = None
+        if params.get("fields"):
+            names = frozenset(name.strip() for name in params["fields"].split(",") if name.strip())
+            unknown = names - set(self.names)
+            if unknown:
+                raise InvalidFieldset(
+                    f"Unknown fields: {', '.join(sorted(unknown))}. Choose from: {', '.join(self.names)}"
+                )
+            names |= frozenset(required)
+
+        excerpt = None
+        if params.get("excerpt"):
+            try:
+                excerpt = int(params["excerpt"])
+            except ValueError:
+                raise InvalidFieldset("excerpt must be a number of characters")
+            maximum = getattr(settings, "DREAM_MAX_EXCERPT", 10000)
+            if not 1 <= excerpt <= maximum:
+                raise InvalidFieldset(f"excerpt must be between 1 and {maximum} characters")
+
+        if names is None and excerpt is None:
+            return self
+        return self.select(names, excerpt)
+
+    def rows(self, queryset):
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset.values(*self.columns)
+
+    def map(self, rows):
+        mapper = self.mapper
+        tz = _output_timezone()
+        return [mapper(row, tz) for row in rows]
+
+    def serialize(self, queryset):
+        return self.map(self.rows(queryset))
+
+    def iterator(self, queryset, chunk_size):
+        mapper = self.mapper
+        tz = _output_timezone()
+        for row in self.rows(queryset).iterator(chunk_size=chunk_size):
+            yield mapper(row, tz)
+
+
+def _column(name):
+    return Field(name, (name,), lambda row, tz: row[name])
+
+
+def _datetime_column(name):
+    return Field(name, (name,), lambda row, tz: _datetime(row[name], tz))
+
+
+_ID = Field("id", ("id",), lambda row, tz: str(row["id"]))
+
+# Same fields and order as DreamSerializer
+DREAMS = Projection([
+    _ID,
+    _column("title"),
+    _column("content"),
+    _column("mood"),
+    _column("tags"),
+    _column("is_public"),
+    _datetime_column("created_at"),
+])
+
+
+# DreamProfileSerializer nested as "profiles", null when the author has no profile
+def _profile(row, tz):
+    if row["user__profile__id"] is None:
+        return None
+    return {
+        "id": row["user__profile__id"],
+        "full_name": row["user__profile__full_name"],
+        "bio": row["user__profile__bio"],
+        "username": row["user__username"],
+        "email": row["user__email"],
+        "created_at": _datetime(row["user__profile__created_at"], tz),
+    }
+
+
+# Same fields and order as PublicDreamSerializer
+PUBLIC_DREAMS = Projection([
+    _ID,
+    _column("title"),
+    _column("content"),
+    _column("mood"),
+    _column("tags"),
+    _datetime_column("created_at"),
+    Field("profiles", ("user__profile__id", "user__profile__full_name", "user__profile__bio",
+                       "user__username", "user__email", "user__profile__created_at"), _profile),
+    Field("reactions", ("heart_count",), lambda row, tz: [{"count": row["heart_count"]}]),
+])
@@ -0,0 +1,220 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Exists, OuterRef
+
+from . import cache
+from .models import Dream, DreamReaction
+from .reactions import HEART, heart_count_subquery
+
+logger = logging.getLogger(__name__)
+
+
+class ReactionBuffer:
+    """
+    Write-behind buffer for heart toggles.
+
+    A toggle is recorded as the user's target state for the dream and
+    answered with the projected count straight away. Toggling back to the
+    state the database already has drops the entry, so bursts of clicks
+    cancel out. A background thread writes what is left in one transaction
+    per flush and recounts the touched dreams from DreamReaction.
+    """
+
+    def __init__(self, max_size=10000, interval=1.0):
+        self.max_size = max_size
+        self.interval = interval
+        # (dream_id, user_id) -> [committed state, target state]
+        self._pending = {}
+        # dream_id -> hearts the buffered toggles add to the committed count
+        self._deltas = defaultdict(int)
+        # Odd while a flush is writing
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and self.interval:
+                self._thread = threading.Thread(target=self._run, name="reaction-flusher", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and write everything still buffered."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered reactions failed")
+        connection.close()
+
+    @contextmanager
+    def _committed(self, read):
+        """
+        Run read() against the database while no flush is writing, and hold
+        the lock for the block so the buffer matches what read() saw.
+        """
+        while True:
+            with self._lock:
+                while self._generation % 2:
+                    self._flushed.wait()
+                generation = self._generation
+            result = read()
+            with self._lock:
+                if generation == self._generation:
+                    yield result
+                    return
+
+    def _add_delta(self, dream_id, delta):
+        self._deltas[dream_id] += delta
+        if not self._deltas[dream_id]:
+            del self._deltas[dream_id]
+
+    def toggle(self, dream, user):
+        """Buffer a toggle and return (hearted, projected heart_count)."""
+        self.start()
+        key = (dream.pk, user.pk)
+
+        def read():
+            # The committed counter and the user's committed heart
+            row = (Dream.objects.filter(pk=dream.pk)
+                   .annotate(hearted=Exists(DreamReaction.objects.filter(
+                       dream=OuterRef("pk"), user=user, reaction_type=HEART)))
+                   .values_list("heart_count", "hearted").first())
+            return row or (0, False)
+
+        while True:
+            with self._committed(read) as (heart_count, hearted):
+                entry = self._pending.get(key)
+                if entry is not None or len(self._pending) < self.max_size:
+                    entry = entry or [hearted, hearted]
+                    entry[1] = not entry[1]
+                    self._add_delta(dream.pk, 1 if entry[1] else -1)
+                    if entry[0] == entry[1]:
+                        del self._pending[key]
+                    else:
+                        self._pending[key] = entry
+                    return entry[1], heart_count + self._deltas.get(dream.pk, 0)
+
+            # Full: write the buffer from this thread before taking more
+            self.flush()
+
+    def overlay(self, user_id, dream_ids, read):
+        """
+        Call read() for committed ({dream_id: count}, {hearted dream_id})
+        and return both with the buffered toggles applied.
+        """
+        with self._committed(read) as (counts, hearted):
+            counts, hearted = dict(counts), set(hearted)
+            for dream_id in counts:
+                counts[dream_id] += self._deltas.get(dream_id, 0)
+            for dream_id in dream_ids:
+                entry = self._pending.get((dream_id, user_id))
+                if entry is not None:
+                    (hearted.add if entry[1] else hearted.discard)(dream_id)
+            return counts, hearted
+
+    def add_counts(self, read):
+        """
+        Call read() for (rows, ...) where rows are .values() dicts of dreams
+        and return it with the buffered toggles added to their heart_count.
+        """
+        with self._committed(read) as result:
+            for row in result[0]:
+                if "heart_count" in row:
+                    row["heart_count"] += self._deltas.get(row["id"], 0)
+            return result
+
+    def flush(self):
+        """Write the buffered toggles, returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+                self._generation += 1
+
+            try:
+                self._write(batch)
+            except Exception:
+                # Nothing was toggled meanwhile, put the batch back as it was
+                with self._lock:
+                    self._pending = batch
+                    self._generation += 1
+                    self._flushed.notify_all()
+                raise
+
+            with self._lock:
+                for (dream_id, _), (_, target) in batch.items():
+                    self._add_delta(dream_id, -1 if target else 1)
+                self._generation += 1
+                self._flushed.notify_all()
+
+        cache.bump_public()
+        return len(batch)
+
+    def _write(self, batch):
+        dream_ids = {dream_id for dream_id, _ in batch}
+        removes = defaultdict(list)
+        for (dream_id, user_id), (_, target) in batch.items():
+            if not target:
+                removes[dream_id].append(user_id)
+
+        with transaction.atomic():
+            # Dreams deleted since the click took their reactions with them
+            existing = set(Dream.objects.filter(pk__in=dream_ids).values_list("pk", flat=True))
+            DreamReaction.objects.bulk_create(
+                [DreamReaction(dream_id=dream_id, user_id=user_id, reaction_type=HEART)
+                 for (dream_id, user_id), (_, target) in batch.items() if target and dream_id in existing],
+                ignore_conflicts=True,
+                batch_size=500,
+            )
+            for dream_id, user_ids in removes.items():
+                DreamReaction.objects.filter(dream_id=dream_id, user_id__in=user_ids, reaction_type=HEART).delete()
+            Dream.objects.filter(pk__in=existing).update(heart_count=heart_count_subquery())
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, "DREAM_REACTION_WRITE_BEHIND", False)
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ReactionBuffer(
+                    getattr(settings, "DREAM_REACTION_BUFFER_SIZE", 10000),
+                    getattr(settings, "DREAM_REACTION_FLUSH_INTERVAL", 1.0),
+                )
+                # Write what is left when the process exits
+                atexit.register(_buffer.stop)
+    return _buffer
@@ -0,0 +1,143 @@
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Dream, DreamReaction
+
+HEART = "heart"
+
+
+def toggle_heart(dream, user):
+    """
+    Toggle the user's heart on a dream and return (hearted, heart_count).
+
+    The reaction row and Dream.heart_count change in one transaction. The
+    delete reports how many rows it removed and the insert ignores a
+    duplicate created by a concurrent request, so double clicks never fail
+    on the unique constraint or leave the counter off by one.
+    """
+    with transaction.atomic():
+        deleted, _ = DreamReaction.objects.filter(
+            dream=dream, user=user, reaction_type=HEART
+        ).delete()
+
+        if deleted:
+            hearted = False
+            delta = -deleted
+        else:
+            hearted = True
+            try:
+                with transaction.atomic():
+                    DreamReaction.objects.create(dream=dream, user=user, reaction_type=HEART)
+                delta = 1
+            except IntegrityError:
+                # Another request inserted the same reaction first
+                delta = 0
+
+        if delta:
+            Dream.objects.filter(pk=dream.pk).update(heart_count=F("heart_count") + delta)
+
+        heart_count = Dream.objects.filter(pk=dream.pk).values_list("heart_count", flat=True).first()
+
+    return hearted, heart_count or 0
+
+
+def _with_buffered(user, dream_ids, read):
+    # Committed state plus toggles still in the write-behind buffer
+    from . import reaction_buffer
+
+    if reaction_buffer.is_enabled():
+        return reaction_buffer.get_buffer().overlay(user.pk, dream_ids, read)
+    return read()
+
+
+def hearted_ids(dream_ids, user):
+    """The subset of dream_ids the user has hearted, in one query."""
+    dream_ids = [uuid.UUID(str(pk)) for pk in dream_ids]
+
+    def read():
+        return {}, set(
+            DreamReaction.objects.filter(dream_id__in=dream_ids, user=user, reaction_type=HEART)
+            .values_list("dream_id", flat=True)
+        )
+
+    return _with_buffered(user, dream_ids, read)[1]
+
+
+def reaction_status(dream_ids, user):
+    """
+    Heart count and the user's own heart for many dreams in two queries,
+    {dream_id: {"count": n, "hearted": bool}}. Dreams that do not exist or
+    are private to someone else are left out.
+    """
+    def read():
+        counts = dict(
+            Dream.objects.filter(Q(is_public=True) | Q(user=user), pk__in=dream_ids)
+            .values_list("pk", "heart_count")
+        )
+        hearted = set(
+            DreamReaction.objects.filter(dream_id__in=counts, user=user, reaction_type=HEART)
+            .values_list("dream_id", flat=True)
+        ) if counts else set()
+        return counts, hearted
+
+    counts, hearted = _with_buffered(user, dream_ids, read)
+    return {pk: {"count": count, "hearted": pk in hearted} for pk, count in counts.items()}
+
+
+def with_buffered_counts(read):
+    """
+    Call read() for (rows, ...) where rows are .values() dicts of dreams, and
+    return it with toggles still in the write-behind buffer counted in.
+    """
+    from . import reaction_buffer
+
+    if reaction_buffer.is_enabled():
+        return reaction_buffer.get_buffer().add_counts(read)
+    return read()
+
+
+def embed_hearted(page, hearted):
+    """
+    Copy of a serialized feed page with "hearted" set on every dream. Kept
+    out of the cached page, which is shared by all users.
+    """
+    hearted = {str(pk) for pk in hearted}
+    return {
+        **page,
+        "results": [{**item, "hearted": str(item["id"]) in hearted} for item in page["results"]],
+    }
+
+
+def heart_count_subquery():
+    counts = (DreamReaction.objects.filter(dream=OuterRef("pk"), reaction_type=HEART)
+              .order_by()
+              .values("dream")
+              .annotate(count=Count("id"))
+              .values("count"))
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def reconcile_heart_counts(dream_ids=None, batch_size=1000):
+    """
+    Reset Dream.heart_count from DreamReaction wherever the two disagree.
+    Returns the number of dreams that were corrected.
+    """
+    dreams = Dream.objects.all()
+    if dream_ids is not None:
+        dreams = dreams.filter(pk__in=dream_ids)
+
+    drifted = list(
+        dreams.annotate(actual=heart_count_subquery())
+        .exclude(heart_count=F("actual"))
+        .values_list("pk", flat=True)
+    )
+
+    for start in range(0, len(drifted), batch_size):
+        batch = drifted[start:start + batch_size]
+        with transaction.atomic():
+            Dream.objects.filter(pk__in=batch).update(heart_count=heart_count_subquery())
+
+    return len(drifted)
@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Subquery
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+
+from .models import ReplicaPin, ReplicaRefresh
+
+# The replica snapshot reads of the current context go to, None for the primary
+_snapshot = ContextVar("dream_replica_snapshot", default=None)
+
+
+def replica_alias():
+    """The configured replica alias, or None when there is no replica."""
+    alias = getattr(settings, "DREAM_REPLICA_ALIAS", "replica")
+    return alias if alias in settings.DATABASES else None
+
+
+def pin_to_primary(user_id):
+    """
+    Send this user's reads to the primary until the replica has been
+    refreshed after this write. Call it once the write is saved.
+    """
+    if replica_alias() is None or user_id is None:
+        return
+    ReplicaPin.objects.bulk_create(
+        [ReplicaPin(user_id=user_id, written_at=timezone.now())],
+        update_conflicts=True, unique_fields=["user"], update_fields=["written_at"],
+    )
+
+
+def mark_refreshed(started_at):
+    """Record a finished copy to the replica that started at `started_at`."""
+    ReplicaRefresh.objects.update_or_create(pk=1, defaults={"started_at": started_at})
+    # Every write before the copy is on the replica now
+    ReplicaPin.objects.filter(written_at__lt=started_at).delete()
+
+
+def replica_state(user_id):
+    """(started_at of the last refresh, the user's last write), from the primary."""
+    pinned = ReplicaPin.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values("written_at")[:1]
+    row = (ReplicaRefresh.objects.using(DEFAULT_DB_ALIAS)
+           .annotate(written_at=Subquery(pinned))
+           .values_list("started_at", "written_at")
+           .first())
+    return row or (None, None)
+
+
+def read_alias():
+    """
+    Where reads of the current context go, part of cache keys and ETags
+    built from them. Replica reads name the refresh they read from, so they
+    are never served once the replica has moved on.
+    """
+    return _snapshot.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def reading_from_replica(user_id=None):
+    """
+    Route ORM reads inside the block to the replica, unless there is none,
+    it was never refreshed, or the user wrote since it was last refreshed
+    and must read their own writes from the primary.
+    """
+    snapshot = None
+    alias = replica_alias()
+    if alias is not None:
+        refreshed_at, written_at = replica_state(user_id)
+        if refreshed_at is not None and (written_at is None or written_at < refreshed_at):
+            snapshot = f"{alias}@{refreshed_at.isoformat()}"
+    token = _snapshot.set(snapshot)
+    try:
+        yield snapshot is not None
+    finally:
+        _snapshot.reset(token)
+
+
+def _replica_reads(view_func):
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with reading_from_replica(request.user.id):
+            return view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+# Decorates the GET handler of an APIView, after authentication has run
+replica_reads = method_decorator(_replica_reads)
+
+
+class ReplicaRouter:
+    """
+    Reads go to the replica only inside reading_from_replica(), everything
+    else, including all writes and reads inside a transaction, goes to the
+    primary. The replica is a copy kept up to date outside Django (see the
+    refresh_replica command), so it is never migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias and _snapshot.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Instances read from the replica are still saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != replica_alias()
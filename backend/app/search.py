@@ -0,0 +1,152 @@
+import re
+
+from django.db import connection
+
+from .models import Dream
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+
+FTS_TABLE = "app_dream_fts"
+
+# Title matches weigh twice as much as content matches in BM25
+TITLE_WEIGHT = 2.0
+CONTENT_WEIGHT = 1.0
+
+INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content, content='app_dream', content_rowid='rowid',
+        tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON app_dream BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON app_dream BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content ON app_dream BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+    END""",
+]
+
+UNINSTALL_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+def is_supported(conn=connection):
+    return conn.vendor == "sqlite"
+
+
+def is_installed(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def install(conn=connection):
+    """Create the FTS5 index and its sync triggers if they are missing."""
+    with conn.cursor() as cursor:
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+
+
+def uninstall(conn=connection):
+    with conn.cursor() as cursor:
+        for sql in UNINSTALL_SQL:
+            cursor.execute(sql)
+
+
+def rebuild(conn=connection):
+    """
+    Re-read every dream into the index. Needed after restoring a database
+    or anything else that rewrites app_dream rowids, e.g. VACUUM. Runs
+    after every migrate, see app.signals.reinstall_search_index.
+    """
+    install(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def build_match_query(text):
+    # Quote every term so user input can never be parsed as FTS5 syntax,
+    # and let the last term match as a prefix for search-as-you-type
+    terms = re.findall(r"\w+", text or "")
+    if not terms:
+        return None
+    quoted = ['"%s"' % term for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_page(match, page_size, cursor=None, user=None, public=False):
+    """
+    Return ([(dream, snippet)], next_cursor) for one page of results ranked by
+    BM25, scoped to the user's own dreams or to public dreams.
+    Pages are keyed on (score, rowid) the same way the feed is keyed on
+    (created_at, id).
+    """
+    if not is_supported():
+        raise SearchUnavailable("Search requires SQLite FTS5")
+
+    where = ["d.is_public = 1" if public else "d.user_id = %s"]
+    params = [match]
+    if not public:
+        params.append(user.id)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 2 or not all(isinstance(v, (int, float)) for v in values):
+            raise InvalidCursor("Invalid cursor")
+        where.append("(s.score > %s OR (s.score = %s AND s.rowid > %s))")
+        params.extend([values[0], values[0], values[1]])
+
+    params.append(page_size + 1)
+    sql = f"""
+        SELECT s.rowid, d.id, s.score FROM (
+            SELECT rowid, bm25({FTS_TABLE}, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS score
+            FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+        ) s
+        JOIN app_dream d ON d.rowid = s.rowid
+        WHERE {" AND ".join(where)}
+        ORDER BY s.score, s.rowid
+        LIMIT %s
+    """
+    with connection.cursor() as c:
+        c.execute(sql, params)
+        rows = c.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([rows[-1][2], rows[-1][0]])
+    if not rows:
+        return [], None
+
+    # Snippets are only built for the rows on this page
+    rowids = [row[0] for row in rows]
+    with connection.cursor() as c:
+        c.execute(
+            f"""SELECT rowid, snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', 16)
+                FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid IN ({", ".join(["%s"] * len(rowids))})""",
+            [match, *rowids],
+        )
+        snippets = dict(c.fetchall())
+
+    dreams = Dream.objects.all()
+    if public:
+        dreams = dreams.select_related("user__profile")
+    by_id = dreams.in_bulk([row[1] for row in rows])
+
+    results = []
+    for rowid, dream_id, score in rows:
+        dream = by_id.get(Dream._meta.pk.to_python(dream_id))
+        if dream is not None:
+            results.append((dream, snippets.get(rowid, "")))
+    return results, next_cursor
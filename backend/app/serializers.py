@@ -99,7 +99,8 @@ class PublicDreamSerializer(serializers.ModelSerializer):
         ]
 
     def get_reactions(self, obj):
-        return [{"count": obj.reactions.filter(reaction_type="heart").count()}]
+        # Read the denormalized counter instead of counting reactions
+        return [{"count": obj.heart_count}]
 
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -0,0 +1,164 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .analytics import apply_daily_stats, record_dreams, stats_day
+from .authentication import invalidate_token
+from .models import ArchivedDream, Dream, DreamReaction, DreamTag
+from .tags import sync_dream_tags
+from . import search, similar, trending
+
+# Set by code that deletes dreams in bulk and updates what is derived from
+# them itself, or on purpose not at all when archiving
+_deletes_handled = ContextVar("deletes_handled", default=False)
+
+
+@contextmanager
+def deletes_handled():
+    token = _deletes_handled.set(True)
+    try:
+        yield
+    finally:
+        _deletes_handled.reset(token)
+
+
+def loaded_value(instance, name):
+    loaded = getattr(instance, "_loaded_values", None) or {}
+    return loaded.get(name, getattr(instance, name))
+
+
+def field_changed(instance, name):
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is None or name not in loaded:
+        return True
+    return loaded[name] != getattr(instance, name)
+
+
+def dreams_created(dreams):
+    """
+    Update everything derived from newly inserted dreams. Called for each
+    save() and directly by code that inserts with bulk_create.
+    """
+    sync_dream_tags(dreams)
+    record_dreams(dreams)
+    trending.record_dreams(dreams)
+    similar.record([d for d in dreams if d.is_public])
+
+
+def _old_state(dream):
+    return (loaded_value(dream, "is_public"), loaded_value(dream, "tags"), loaded_value(dream, "mood"))
+
+
+def dreams_updated(dreams):
+    """
+    Update everything derived from changed dreams, comparing them with the
+    values they were loaded with. Called for each save() and directly by
+    code that writes with bulk_update.
+    """
+    sync_dream_tags([d for d in dreams if field_changed(d, "tags")])
+
+    deltas = {}
+    changes = []
+    for dream in dreams:
+        old_mood = loaded_value(dream, "mood")
+        if old_mood != dream.mood:
+            day = stats_day(dream.created_at)
+            for key, delta in (((dream.user_id, day, old_mood), -1), ((dream.user_id, day, dream.mood), 1)):
+                deltas[key] = deltas.get(key, 0) + delta
+        if any(field_changed(dream, name) for name in ("is_public", "tags", "mood")):
+            changes.append((dream.created_at, _old_state(dream), (dream.is_public, dream.tags, dream.mood)))
+    apply_daily_stats(deltas)
+    trending.record_changes(changes)
+
+    changed = [d for d in dreams if any(field_changed(d, name) for name in ("title", "content", "tags", "is_public"))]
+    similar.record(
+        [d for d in changed if d.is_public],
+        removed_ids=[d.pk for d in changed if not d.is_public and loaded_value(d, "is_public")],
+    )
+
+
+def delete_dependents(dream_ids):
+    # Not cascaded by the database, see DreamTag
+    DreamTag.objects.filter(dream_id__in=dream_ids).delete()
+    DreamReaction.objects.filter(dream_id__in=dream_ids).delete()
+
+
+def dreams_deleted(dreams):
+    """
+    Update everything derived from deleted dreams. Called for each delete()
+    and directly by code that deletes in bulk inside deletes_handled().
+    """
+    delete_dependents([d.pk for d in dreams])
+    deltas = {}
+    for dream in dreams:
+        key = (dream.user_id, stats_day(dream.created_at), loaded_value(dream, "mood"))
+        deltas[key] = deltas.get(key, 0) - 1
+    apply_daily_stats(deltas)
+    public = [d for d in dreams if loaded_value(d, "is_public")]
+    trending.record_changes([(d.created_at, _old_state(d), (False, None, None)) for d in public])
+    similar.record(removed_ids=[d.pk for d in public])
+
+
+@receiver(post_save, sender=Dream, dispatch_uid="dream_saved")
+def dream_saved(sender, instance, created, **kwargs):
+    if created:
+        dreams_created([instance])
+    else:
+        dreams_updated([instance])
+
+
+@receiver(post_delete, sender=Dream, dispatch_uid="dream_deleted")
+def dream_deleted(sender, instance, **kwargs):
+    if not _deletes_handled.get():
+        dreams_deleted([instance])
+
+
+@receiver(post_delete, sender=ArchivedDream, dispatch_uid="archived_dream_deleted")
+def archived_dream_deleted(sender, instance, **kwargs):
+    # Archived dreams are older than every trending window
+    delete_dependents([instance.pk])
+    record_dreams([instance], sign=-1)
+
+
+# Keep CachedTokenAuthentication from accepting revoked tokens
+
+@receiver(post_delete, sender=Token, dispatch_uid="token_deleted")
+def token_deleted(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User, dispatch_uid="user_saved")
+def user_saved(sender, instance, created, **kwargs):
+    # Covers deactivation as well as staff or permission changes
+    if not created:
+        for key in Token.objects.filter(user=instance).values_list("key", flat=True):
+            invalidate_token(key)
+
+
+# Tune every new SQLite connection, see SQLITE_PRAGMAS in settings
+
+@receiver(connection_created, dispatch_uid="configure_sqlite")
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(post_migrate, dispatch_uid="reinstall_search_index")
+def reinstall_search_index(sender, app_config, using, **kwargs):
+    # Migrations that remake app_dream (most AlterField and RemoveField on
+    # SQLite) drop the index triggers and renumber its rowids
+    if app_config.label != "app":
+        return
+    conn = connections[using]
+    if search.is_supported(conn) and search.is_installed(conn):
+        search.rebuild(conn)
@@ -0,0 +1,326 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from array import array
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from . import cache, jobs
+from .models import Dream, SimilarDreamVector
+from .tags import normalize_tags
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+# Title words count twice as much as content words, like TITLE_WEIGHT in
+# app.search, and tags three times
+TITLE_WEIGHT = 2
+CONTENT_WEIGHT = 1
+TAG_WEIGHT = 3
+
+CURRENT_FILE = "current"
+ARRAYS = ("ids", "idf", "data", "indices", "indptr")
+
+_token_re = re.compile(r"\w\w+")
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+class SimilarityUnavailable(Exception):
+    pass
+
+
+def is_enabled():
+    return getattr(settings, "DREAM_SIMILAR_DREAMS", True)
+
+
+def index_dir():
+    return getattr(settings, "DREAM_SIMILAR_INDEX_DIR", os.path.join(settings.BASE_DIR, "similar_index"))
+
+
+def _require_numpy():
+    if np is None:
+        raise SimilarityUnavailable("Similar dreams need NumPy and SciPy installed")
+
+
+def _term(token):
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(token.encode())
+
+
+def term_frequencies(title, content, tags):
+    """Sublinear term frequencies of a dream, keyed by 32-bit term hash."""
+    counts = {}
+    for weight, tokens in (
+        (TITLE_WEIGHT, _token_re.findall((title or "").lower())),
+        (CONTENT_WEIGHT, _token_re.findall((content or "").lower())),
+        (TAG_WEIGHT, ["#" + tag.lower() for tag in normalize_tags(tags)]),
+    ):
+        for token in tokens:
+            term = _term(token)
+            counts[term] = counts.get(term, 0) + weight
+    return {term: 1 + math.log(count) for term, count in counts.items()}
+
+
+def _packed(frequencies):
+    return array("I", frequencies.keys()).tobytes(), array("f", frequencies.values()).tobytes()
+
+
+def has_index():
+    return os.path.exists(os.path.join(index_dir(), CURRENT_FILE))
+
+
+def record(dreams=(), removed_ids=()):
+    """
+    Remember public dreams that were added or changed, and ids of dreams
+    that are no longer public, until the next build folds them in. Nothing
+    is kept before the first build, which reads every public dream anyway.
+    """
+    if not is_enabled() or not has_index():
+        return
+    rows = {}
+    for dream in dreams:
+        features, weights = _packed(term_frequencies(dream.title, dream.content, dream.tags))
+        rows[dream.pk] = SimilarDreamVector(dream_id=dream.pk, features=features, weights=weights)
+    for dream_id in removed_ids:
+        rows[dream_id] = SimilarDreamVector(dream_id=dream_id, features=b"", weights=b"", removed=True)
+    if not rows:
+        return
+    SimilarDreamVector.objects.bulk_create(
+        rows.values(), update_conflicts=True, unique_fields=["dream_id"],
+        update_fields=["features", "weights", "removed", "updated_at"],
+    )
+    # Every query reweighs the whole delta, keep it small
+    if SimilarDreamVector.objects.count() >= getattr(settings, "DREAM_SIMILAR_MAX_DELTA", 5000):
+        transaction.on_commit(lambda: jobs.enqueue("similar.build", dedupe_key="similar.build"))
+
+
+def delta_marker():
+    """Changes to SimilarDreamVector, as seen by every process."""
+    marker = SimilarDreamVector.objects.aggregate(count=Count("pk"), updated_at=Max("updated_at"))
+    return marker["count"], marker["updated_at"]
+
+
+def _weigh(terms, frequencies, features, idf):
+    """
+    Hash terms into `features` columns, merging collisions, and return the
+    columns with their L2-normalized tf-idf weights.
+    """
+    columns, inverse = np.unique(terms % features, return_inverse=True)
+    weights = np.bincount(inverse, weights=frequencies).astype(np.float32) * idf[columns]
+    norm = np.linalg.norm(weights)
+    if norm:
+        weights /= norm
+    return columns.astype(np.int32), weights
+
+
+def _query_vector(dream, index):
+    frequencies = term_frequencies(dream.title, dream.content, dream.tags)
+    terms = np.fromiter(frequencies.keys(), dtype=np.uint32, count=len(frequencies))
+    values = np.fromiter(frequencies.values(), dtype=np.float32, count=len(frequencies))
+    return _weigh(terms, values, index.features, index.idf)
+
+
+class SimilarIndex:
+    """
+    One build of the index, memory-mapped from its directory: a documents x
+    features CSC matrix of normalized tf-idf weights, so a query only reads
+    the columns of its own terms, plus the dream ids of the rows and the idf
+    of every feature at build time.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.build = self.manifest["build"]
+        self.features = self.manifest["features"]
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        self.ids = arrays["ids"]
+        self.idf = arrays["idf"]
+        self.matrix = sparse.csc_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(self.manifest["documents"], self.features), copy=False,
+        )
+        self._rows = None
+
+    def dream_id(self, row):
+        return uuid.UUID(bytes=self.ids[row].tobytes())
+
+    def row_of(self, dream_id):
+        if self._rows is None:
+            packed = self.ids.tobytes()
+            self._rows = {packed[i:i + 16]: row for row, i in enumerate(range(0, len(packed), 16))}
+        return self._rows.get(dream_id.bytes)
+
+
+class Delta:
+    """
+    Public dreams changed since the build, weighted with the build's idf,
+    and the base rows they replace or remove.
+    """
+
+    def __init__(self, index, vectors):
+        self.masked = np.zeros(index.matrix.shape[0], dtype=bool)
+        self.ids = []
+        rows, columns, weights = [], [], []
+        for vector in vectors:
+            row = index.row_of(vector.dream_id)
+            if row is not None:
+                self.masked[row] = True
+            if vector.removed:
+                continue
+            cols, values = _weigh(
+                np.frombuffer(bytes(vector.features), dtype=np.uint32),
+                np.frombuffer(bytes(vector.weights), dtype=np.float32),
+                index.features, index.idf,
+            )
+            rows.append(np.full(len(cols), len(self.ids), dtype=np.int32))
+            columns.append(cols)
+            weights.append(values)
+            self.ids.append(vector.dream_id)
+        if self.ids:
+            coo = (np.concatenate(weights), (np.concatenate(rows), np.concatenate(columns)))
+        else:
+            coo = (np.zeros(0, dtype=np.float32), (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)))
+        self.matrix = sparse.csc_matrix(coo, shape=(len(self.ids), index.features), dtype=np.float32)
+
+
+def current():
+    """The current build and delta, reloaded when either changed."""
+    _require_numpy()
+    path = index_dir()
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            build = f.read().strip()
+    except FileNotFoundError:
+        raise SimilarityUnavailable("The similar dreams index has not been built, run build_similar_index")
+
+    marker = delta_marker()
+    with _lock:
+        index = _loaded.get("index")
+        if index is None or index.build != build:
+            index = _loaded["index"] = SimilarIndex(os.path.join(path, build))
+            _loaded.pop("delta", None)
+        loaded = _loaded.get("delta")
+        if loaded is None or loaded[0] != marker:
+            loaded = _loaded["delta"] = (marker, Delta(index, SimilarDreamVector.objects.all()))
+    return index, loaded[1]
+
+
+def similar_to(dream, limit):
+    """[(dream id, score)] of the public dreams most like `dream`, best first."""
+    index, delta = current()
+    columns, query = _query_vector(dream, index)
+    if not len(columns):
+        return []
+
+    base_scores = index.matrix[:, columns] @ query
+    base_scores[delta.masked] = 0
+    delta_scores = delta.matrix[:, columns] @ query
+    scores = np.concatenate([base_scores, delta_scores])
+    own_row = index.row_of(dream.pk)
+    if own_row is not None:
+        scores[own_row] = 0
+    if dream.pk in delta.ids:
+        scores[len(base_scores) + delta.ids.index(dream.pk)] = 0
+
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+    candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    base = len(base_scores)
+    return [
+        (index.dream_id(i) if i < base else delta.ids[i - base], float(scores[i]))
+        for i in candidates
+    ]
+
+
+def build(batch_size=2000):
+    """
+    Vectorize every public dream into a new build, make it the current one
+    and drop the changes it includes. Returns the build's manifest.
+    """
+    _require_numpy()
+    features = getattr(settings, "DREAM_SIMILAR_FEATURES", 2 ** 18)
+    started = timezone.now()
+
+    ids = bytearray()
+    rows, columns, frequencies = array("i"), array("i"), array("f")
+    documents = 0
+    dreams = Dream.objects.filter(is_public=True).values_list("id", "title", "content", "tags")
+    for dream_id, title, content, tags in dreams.iterator(chunk_size=batch_size):
+        merged = {}
+        for term, value in term_frequencies(title, content, tags).items():
+            column = term % features
+            merged[column] = merged.get(column, 0) + value
+        ids += dream_id.bytes
+        rows.extend([documents] * len(merged))
+        columns.extend(merged.keys())
+        frequencies.extend(merged.values())
+        documents += 1
+
+    rows = np.frombuffer(rows, dtype=np.int32)
+    columns = np.frombuffer(columns, dtype=np.int32)
+    weights = np.frombuffer(frequencies, dtype=np.float32).copy()
+    document_frequency = np.bincount(columns, minlength=features)
+    idf = (np.log((1 + documents) / (1 + document_frequency)) + 1).astype(np.float32)
+    weights *= idf[columns]
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=documents)).astype(np.float32)
+    weights /= norms[rows]
+    matrix = sparse.csc_matrix((weights, (rows, columns)), shape=(documents, features), dtype=np.float32)
+    matrix.sort_indices()
+    # Same dtype for both, or scipy copies them when the build is loaded
+    index_dtype = np.int32 if matrix.nnz < 2 ** 31 else np.int64
+
+    build_id = str(time.time_ns())
+    root = index_dir()
+    path = os.path.join(root, build_id)
+    os.makedirs(path)
+    arrays = {
+        "ids": np.frombuffer(bytes(ids), dtype=np.uint8).reshape(documents, 16),
+        "idf": idf,
+        "data": matrix.data,
+        "indices": matrix.indices.astype(index_dtype),
+        "indptr": matrix.indptr.astype(index_dtype),
+    }
+    for name, value in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), value)
+    manifest = {
+        "build": build_id, "built_at": started.isoformat(), "documents": documents,
+        "features": features, "nnz": int(matrix.nnz),
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    # Switch atomically, workers pick the new build up on their next query
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(build_id)
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+    _remove_old_builds(root, keep=2)
+
+    SimilarDreamVector.objects.filter(updated_at__lte=started).delete()
+    cache.bump_public()
+    return manifest
+
+
+def _remove_old_builds(root, keep):
+    # Workers may still map the previous build until their next query
+    builds = sorted((name for name in os.listdir(root) if name.isdigit()), key=int)
+    for name in builds[:-keep]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,27 @@
+from .models import DreamTag
+
+MAX_TAG_LENGTH = 100
+
+
+def normalize_tags(tags):
+    if not isinstance(tags, list):
+        return []
+    seen = []
+    for tag in tags:
+        tag = str(tag).strip()[:MAX_TAG_LENGTH]
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def sync_dream_tags(dreams):
+    """Rewrite the DreamTag rows of the given dreams from their tags field."""
+    dreams = list(dreams)
+    if not dreams:
+        return
+    DreamTag.objects.filter(dream__in=[d.pk for d in dreams]).delete()
+    DreamTag.objects.bulk_create([
+        DreamTag(dream_id=d.pk, user_id=d.user_id, tag=tag)
+        for d in dreams
+        for tag in normalize_tags(d.tags)
+    ])
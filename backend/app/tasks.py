@@ -0,0 +1,38 @@
+from django.contrib.auth.models import User
+
+from . import cache, similar, trending
+from .analytics import get_analytics, rebuild_daily_stats
+from .jobs import task
+from .reactions import reconcile_heart_counts
+from .serializers import AnalyticsSerializer
+
+
+@task("analytics.refresh")
+def refresh_analytics(user_id, parts):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return
+    cache.store("analytics", cache.user_scope(user_id), parts, AnalyticsSerializer(get_analytics(user)).data)
+
+
+@task("analytics.rebuild_daily_stats")
+def rebuild_stats(user_ids=None):
+    rebuild_daily_stats(user_ids=user_ids)
+    for user_id in user_ids or User.objects.values_list("pk", flat=True):
+        cache.bump_user(user_id)
+
+
+@task("reactions.reconcile")
+def reconcile_hearts(dream_ids=None):
+    if reconcile_heart_counts(dream_ids=dream_ids):
+        cache.bump_public()
+
+
+@task("trending.compact")
+def compact_trending():
+    trending.compact()
+
+
+@task("similar.build")
+def build_similar_index():
+    similar.build()
@@ -1,3 +1,1149 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import (
+    Profile, ArchivedDream, Dream, DreamReaction, DreamTag, Job, ReplicaPin, ReplicaRefresh, SimilarDreamVector,
+    TrendingCounter, UserDailyStats,
+)
+from .analytics import get_analytics, rebuild_daily_stats
+from .authentication import get_local_cache
+from .cache import get_cache, stats as cache_stats
+from .serializers import DreamSerializer, PublicDreamSerializer
+from . import jobs, routers, similar, trending
+from .projections import DREAMS, PUBLIC_DREAMS
+from .reaction_buffer import ReactionBuffer
+from .reactions import reconcile_heart_counts, toggle_heart
+
+
+def make_user(username):
+    user = User.objects.create_user(username=username, email=f"{username}@example.com", password="password123")
+    Profile.objects.create(user=user)
+    return user
+
+
+class DreamTestCase(TestCase):
+    def setUp(self):
+        # Cached responses and tokens would otherwise leak between tests
+        get_cache().clear()
+        get_local_cache().clear()
+        super().setUp()
+
+
+def make_client(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return client
+
+
+class PublicFeedPaginationTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+        base = now()
+        for i in range(5):
+            dream = Dream.objects.create(user=self.user, title=f"Dream {i}", content="...")
+            # Two dreams share a timestamp so the id tie-breaker is exercised
+            Dream.objects.filter(pk=dream.pk).update(created_at=base - timedelta(minutes=i // 2))
+        Dream.objects.create(user=self.user, title="Secret", content="...", is_public=False)
+
+    def test_pages_cover_feed_without_gaps_or_duplicates(self):
+        seen = []
+        cursor = None
+        while True:
+            url = "/app/dreams/public/?page_size=2"
+            if cursor:
+                url += f"&cursor={cursor}"
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(d["id"] for d in response.data["results"])
+            cursor = response.data["next"]
+            if not cursor:
+                break
+
+        expected = [
+            str(pk) for pk in Dream.objects.filter(is_public=True)
+            .order_by("-created_at", "-id").values_list("id", flat=True)
+        ]
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/app/dreams/public/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+
+
+class PublicFeedQueryCountTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+        # Warm the token cache so both measurements skip authentication
+        self.client.get("/app/auth/me/")
+
+    def add_dreams(self, count):
+        for i in range(count):
+            author = make_user(f"author{Dream.objects.count()}")
+            dream = Dream.objects.create(user=author, title=f"Dream {i}", content="...")
+            toggle_heart(dream, self.user)
+
+    def feed_query_count(self, page_size):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/app/dreams/public/?page_size={page_size}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), page_size)
+        self.assertTrue(all(d["reactions"] == [{"count": 1}] for d in response.data["results"]))
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_page_size(self):
+        self.add_dreams(2)
+        small = self.feed_query_count(2)
+        self.add_dreams(18)
+        large = self.feed_query_count(20)
+        self.assertEqual(small, large)
+
+
+class ToggleReactionTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.user = make_user("reader")
+        self.client = make_client(self.user)
+        self.dream = Dream.objects.create(user=self.author, title="Flying", content="...")
+
+    def test_toggle_updates_counter(self):
+        url = f"/app/dreams/{self.dream.id}/react/"
+        response = self.client.post(url)
+        self.assertEqual((response.data["heart_count"], response.data["hearted"]), (1, True))
+        self.dream.refresh_from_db()
+        self.assertEqual(self.dream.heart_count, 1)
+
+        response = self.client.post(url)
+        self.assertEqual((response.data["heart_count"], response.data["hearted"]), (0, False))
+        self.assertFalse(DreamReaction.objects.filter(dream=self.dream).exists())
+
+    def test_reconcile_fixes_drifted_counter(self):
+        DreamReaction.objects.create(dream=self.dream, user=self.user)
+        self.assertEqual(reconcile_heart_counts(), 1)
+        self.dream.refresh_from_db()
+        self.assertEqual(self.dream.heart_count, 1)
+        self.assertEqual(reconcile_heart_counts(), 0)
+
+
+class DreamTagIndexTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def test_index_follows_create_update_and_delete(self):
+        dream = Dream.objects.create(user=self.user, title="Sea", content="...", tags=["ocean", "flying", "ocean"])
+        self.assertEqual(sorted(dream.tag_index.values_list("tag", flat=True)), ["flying", "ocean"])
+
+        self.client.put(f"/app/dreams/{dream.id}/", {"tags": ["falling"]}, format="json")
+        self.assertEqual(list(dream.tag_index.values_list("tag", flat=True)), ["falling"])
+
+        dream.delete()
+        self.assertFalse(DreamTag.objects.exists())
+
+    def test_tags_changed_in_place_are_reindexed(self):
+        Dream.objects.create(user=self.user, title="Sea", content="...", tags=["ocean"])
+        dream = Dream.objects.get()
+        self.assertEqual(set(dream._loaded_values), set(Dream.TRACKED_FIELDS))
+
+        dream.tags.append("flying")
+        dream.save()
+        self.assertEqual(sorted(dream.tag_index.values_list("tag", flat=True)), ["flying", "ocean"])
+
+    def test_filter_and_analytics_use_tags(self):
+        Dream.objects.create(user=self.user, title="A", content="...", tags=["ocean"])
+        Dream.objects.create(user=self.user, title="B", content="...", tags=["ocean", "forest"])
+
+        response = self.client.get("/app/dreams/?tag=forest")
+        self.assertEqual([d["title"] for d in response.data], ["B"])
+
+        response = self.client.get("/app/analytics/")
+        self.assertEqual(response.data["topTags"], [{"tag": "ocean", "count": 2}, {"tag": "forest", "count": 1}])
+
+
+class AnalyticsRollupTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def test_rollup_tracks_saves_and_deletes(self):
+        calm = Dream.objects.create(user=self.user, title="A", content="...", mood="calm")
+        Dream.objects.create(user=self.user, title="B", content="...", mood="calm")
+        Dream.objects.create(user=self.user, title="C", content="...", mood="scared")
+
+        calm.mood = "scared"
+        calm.save()
+        Dream.objects.get(title="B").delete()
+
+        live = self.client.get("/app/analytics/").data
+        self.assertEqual(live["totalDreams"], 2)
+        self.assertEqual(live["thisMonth"], 2)
+        self.assertEqual(live["mostCommonMood"], "scared")
+        self.assertEqual(live["moodDistribution"], [{"mood": "scared", "count": 2}])
+        self.assertEqual(live["recentActivity"][-1]["count"], 2)
+
+        # A full rebuild agrees with the incrementally maintained rows
+        rebuild_daily_stats()
+        self.assertEqual(self.client.get("/app/analytics/").data, live)
+
+    def test_dreams_without_a_mood_share_one_row(self):
+        Dream.objects.create(user=self.user, title="A", content="...")
+        Dream.objects.create(user=self.user, title="B", content="...")
+        row = UserDailyStats.objects.get()
+        self.assertIsNone(row.mood)
+        self.assertEqual(row.count, 2)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserDailyStats.objects.create(user=self.user, day=row.day, mood=None, count=1)
+
+
+class ResponseCacheTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def test_writes_invalidate_cached_lists(self):
+        self.assertEqual(self.client.get("/app/dreams/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/app/dreams/")["X-Cache"], "HIT")
+        self.assertEqual(self.client.get("/app/dreams/public/")["X-Cache"], "MISS")
+
+        self.client.post("/app/dreams/", {"title": "New", "content": "..."}, format="json")
+
+        response = self.client.get("/app/dreams/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.data), 1)
+        response = self.client.get("/app/dreams/public/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertGreaterEqual(cache_stats()["dreams"]["hits"], 1)
+
+
+class DreamSearchTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.other = make_user("other")
+        self.client = make_client(self.user)
+        Dream.objects.create(user=self.user, title="Ocean", content="I was swimming with whales", is_public=False)
+        Dream.objects.create(user=self.other, title="Whales", content="Whales sang under the ocean")
+        Dream.objects.create(user=self.other, title="Hidden", content="Whales again", is_public=False)
+
+    def test_search_own_dreams(self):
+        response = self.client.get("/app/dreams/search/?q=whale")
+        self.assertEqual([d["title"] for d in response.data["results"]], ["Ocean"])
+        self.assertIn("<mark>", response.data["results"][0]["snippet"])
+
+    def test_search_public_dreams_follows_edits(self):
+        response = self.client.get("/app/dreams/search/?q=whales&scope=public")
+        self.assertEqual([d["title"] for d in response.data["results"]], ["Whales"])
+
+        Dream.objects.filter(title="Whales").update(title="Songs", content="Nothing here")
+        response = self.client.get("/app/dreams/search/?q=whales&scope=public")
+        self.assertEqual(response.data["results"], [])
+
+    def test_search_pagination(self):
+        for i in range(3):
+            Dream.objects.create(user=self.user, title=f"Whale {i}", content="whale", is_public=False)
+        seen = []
+        cursor = ""
+        while True:
+            response = self.client.get(f"/app/dreams/search/?q=whale&page_size=2&cursor={cursor}")
+            seen.extend(d["id"] for d in response.data["results"])
+            cursor = response.data["next"]
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+
+
+class SearchIndexMigrationTests(TransactionTestCase):
+    def test_index_survives_a_remade_dream_table(self):
+        get_cache().clear()
+        user = make_user("dreamer")
+        client = make_client(user)
+        Dream.objects.create(user=user, title="Whales", content="Whales sang under the ocean")
+
+        # What SQLite migrations altering a Dream field do, triggers included
+        with connection.schema_editor() as editor:
+            editor._remake_table(Dream)
+        Dream.objects.create(user=user, title="Dolphins", content="Whales and dolphins")
+        call_command("migrate", verbosity=0)
+
+        response = client.get("/app/dreams/search/?q=whales&scope=public")
+        self.assertEqual(sorted(d["title"] for d in response.data["results"]), ["Dolphins", "Whales"])
+        Dream.objects.filter(title="Whales").update(title="Sea", content="Only the sea")
+        response = client.get("/app/dreams/search/?q=whales&scope=public")
+        self.assertEqual([d["title"] for d in response.data["results"]], ["Dolphins"])
+
+
+class CachedTokenAuthenticationTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def test_token_lookup_is_cached(self):
+        self.client.get("/app/auth/me/")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get("/app/auth/me/").status_code, 200)
+        self.assertFalse(any("authtoken_token" in q["sql"] for q in ctx.captured_queries))
+
+    def test_logout_invalidates_cached_token(self):
+        self.assertEqual(self.client.get("/app/auth/me/").status_code, 200)
+        self.client.post("/app/auth/logout/")
+        self.assertEqual(self.client.get("/app/auth/me/").status_code, 401)
+
+    def test_deactivation_invalidates_cached_token(self):
+        self.assertEqual(self.client.get("/app/auth/me/").status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/app/auth/me/").status_code, 401)
+
+
+# One test process, so its local memory cache is shared by every request
+@override_settings(DREAM_CACHE_SHARED=True)
+class ConditionalGetTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def test_unchanged_list_returns_304_without_queries(self):
+        etag = self.client.get("/app/dreams/")["ETag"]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/app/dreams/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        self.client.post("/app/dreams/", {"title": "New", "content": "..."}, format="json")
+        response = self.client.get("/app/dreams/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_profile_etag_follows_updates(self):
+        etag = self.client.get("/app/auth/profile/")["ETag"]
+        self.assertEqual(self.client.get("/app/auth/profile/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.put("/app/auth/profile/", {"bio": "Lucid dreamer"}, format="json")
+        self.assertEqual(self.client.get("/app/auth/profile/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(DREAM_CACHE_SHARED=False)
+    def test_no_etags_without_a_shared_cache(self):
+        for url in ["/app/dreams/", "/app/dreams/public/", "/app/analytics/", "/app/auth/profile/", "/app/async/dreams/"]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header("ETag"), url)
+
+
+class DreamTransferTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def test_export_then_import_round_trip(self):
+        Dream.objects.create(user=self.user, title="Old", content="...", mood="calm", tags=["sea"])
+        Dream.objects.create(user=self.user, title="New", content="...", is_public=False)
+        response = self.client.get("/app/dreams/export/")
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content)
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([r["title"] for r in rows], ["Old", "New"])
+
+        other = make_user("other")
+        body += b'{"title": ""}\nnot json\n'
+        response = make_client(other).post(
+            "/app/dreams/import/?batch_size=1", body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([e["line"] for e in response.data["errors"]], [3, 4])
+
+        imported = Dream.objects.filter(user=other).order_by("created_at")
+        self.assertEqual([d.created_at.isoformat() for d in imported],
+                         [d.created_at.isoformat() for d in Dream.objects.filter(user=self.user).order_by("created_at")])
+        self.assertEqual(list(DreamTag.objects.filter(user=other).values_list("tag", flat=True)), ["sea"])
+        self.assertEqual(make_client(other).get("/app/analytics/").data["totalDreams"], 2)
+
+    def test_import_reads_naive_timestamps_as_local_time(self):
+        body = (
+            '{"title": "Naive", "content": "...", "created_at": "2020-01-01T00:00:00"}\n'
+            '{"title": "Garbled", "content": "...", "created_at": "yesterday"}\n'
+            '{"title": "Number", "content": "...", "created_at": 1577836800}\n'
+        )
+        response = self.client.post("/app/dreams/import/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual([(e["line"], list(e["errors"])) for e in response.data["errors"]],
+                         [(2, ["created_at"]), (3, ["created_at"])])
+
+        dream = Dream.objects.get(user=self.user)
+        self.assertEqual(timezone.localtime(dream.created_at).replace(tzinfo=None).isoformat(), "2020-01-01T00:00:00")
+        self.assertEqual(UserDailyStats.objects.get(user=self.user).day.isoformat(), "2020-01-01")
+
+
+@override_settings(DREAM_CACHE_SHARED=True)
+class AsyncViewTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+        Dream.objects.create(user=self.user, title="A", content="...", mood="calm", tags=["sea"])
+        Dream.objects.create(user=self.user, title="B", content="...", is_public=False)
+
+    def test_async_views_match_sync_views(self):
+        for sync_url, async_url in [
+            ("/app/dreams/public/?page_size=1", "/app/async/dreams/public/?page_size=1"),
+            ("/app/dreams/", "/app/async/dreams/"),
+            ("/app/analytics/", "/app/async/analytics/"),
+        ]:
+            get_cache().clear()
+            expected = self.client.get(sync_url)
+            get_cache().clear()
+            actual = self.client.get(async_url)
+            self.assertEqual(actual.status_code, 200)
+            self.assertEqual(actual.content, expected.content)
+
+            response = self.client.get(async_url, HTTP_IF_NONE_MATCH=actual["ETag"])
+            self.assertEqual(response.status_code, 304)
+
+    def test_async_views_require_authentication(self):
+        self.assertEqual(APIClient().get("/app/async/dreams/").status_code, 401)
+
+
+class SQLitePragmaTests(TestCase):
+    def test_new_connections_get_the_configured_pragmas(self):
+        # The test database lives in memory, which has no WAL, so open a file
+        with tempfile.TemporaryDirectory() as directory:
+            default = connections["default"]
+            settings_dict = {**default.settings_dict, "NAME": os.path.join(directory, "pragmas.sqlite3")}
+            conn = default.__class__(settings_dict, alias="pragmas")
+            try:
+                with conn.cursor() as cursor:
+                    values = {}
+                    for name in ("journal_mode", "busy_timeout", "synchronous"):
+                        cursor.execute(f"PRAGMA {name}")
+                        values[name] = cursor.fetchone()[0]
+            finally:
+                conn.close()
+
+        pragmas = settings.SQLITE_PRAGMAS
+        self.assertEqual(values["journal_mode"].lower(), str(pragmas["journal_mode"]).lower())
+        self.assertEqual(values["busy_timeout"], pragmas["busy_timeout"])
+        levels = {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}
+        self.assertEqual(values["synchronous"], levels[str(pragmas["synchronous"]).upper()])
+
+
+class SeedDreamsTests(DreamTestCase):
+    def test_seeded_data_is_consistent(self):
+        call_command("seed_dreams", users=5, dreams=6, reactions=3, seed=7, stdout=StringIO())
+
+        self.assertEqual(reconcile_heart_counts(), 0)
+        total = UserDailyStats.objects.aggregate(total=Sum("count"))["total"] or 0
+        self.assertEqual(total, Dream.objects.count())
+        self.assertEqual(
+            DreamTag.objects.count(),
+            sum(len(set(tags)) for tags in Dream.objects.values_list("tags", flat=True)),
+        )
+
+
+class InstrumentationTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get("/app/dreams/")
+        self.assertIn("db;dur=", response["Server-Timing"])
+        self.assertIn("render;dur=", response["Server-Timing"])
+
+        self.assertEqual(self.client.get("/app/metrics/").status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        body = self.client.get("/app/metrics/").content.decode()
+        self.assertIn('dream_request_duration_seconds_count{view="dreams"}', body)
+        self.assertIn('dream_responses_total{view="dreams",status="200"}', body)
+
+    async def test_async_requests_are_measured(self):
+        token = await Token.objects.aget(user=self.user)
+        response = await self.async_client.get("/app/async/dreams/", headers={"Authorization": f"Token {token.key}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response["Server-Timing"], r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+
+
+class ReactionStatusTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.other = make_user("other")
+        self.client = make_client(self.user)
+        self.dreams = [Dream.objects.create(user=self.other, title=f"D{i}", content="...") for i in range(3)]
+        self.private = Dream.objects.create(user=self.other, title="P", content="...", is_public=False)
+        toggle_heart(self.dreams[0], self.user)
+        toggle_heart(self.dreams[0], self.other)
+        toggle_heart(self.dreams[1], self.other)
+
+    def test_status_for_many_dreams_in_two_queries(self):
+        ids = ",".join(str(d.id) for d in self.dreams + [self.private])
+        self.client.get("/app/auth/me/")  # cache the token
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/app/dreams/reactions/?ids={ids}")
+        self.assertEqual(response.data["results"], {
+            str(self.dreams[0].id): {"count": 2, "hearted": True},
+            str(self.dreams[1].id): {"count": 1, "hearted": False},
+            str(self.dreams[2].id): {"count": 0, "hearted": False},
+        })
+        self.assertEqual(self.client.get("/app/dreams/reactions/?ids=nope").status_code, 400)
+
+    def test_feed_embeds_hearted_without_per_row_queries(self):
+        self.client.get("/app/dreams/public/")  # cache the page and the token
+        with self.assertNumQueries(1):
+            response = self.client.get("/app/dreams/public/?include=hearted")
+        hearted = {item["id"]: item["hearted"] for item in response.data["results"]}
+        self.assertEqual(hearted, {str(d.id): d == self.dreams[0] for d in self.dreams})
+
+        # The shared page stays free of per-user state
+        other = make_client(self.other).get("/app/dreams/public/")
+        self.assertNotIn("hearted", other.data["results"][0])
+        async_response = self.client.get("/app/async/dreams/public/?include=hearted")
+        self.assertEqual(async_response.content, response.content)
+
+
+class ReactionBufferTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.other = make_user("other")
+        self.dreams = [Dream.objects.create(user=self.other, title=f"D{i}", content="...") for i in range(3)]
+        # No flusher thread, the tests flush by hand
+        self.buffer = ReactionBuffer(max_size=2, interval=None)
+
+    def test_toggles_cancel_out_and_flush_in_one_batch(self):
+        dream = self.dreams[0]
+        self.assertEqual(self.buffer.toggle(dream, self.user), (True, 1))
+        self.assertEqual(self.buffer.toggle(dream, self.user), (False, 0))
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(self.buffer.toggle(dream, self.user), (True, 1))
+        self.assertEqual(self.buffer.toggle(dream, self.other), (True, 2))
+        self.assertFalse(DreamReaction.objects.exists())
+        self.assertEqual(self.buffer.flush(), 2)
+
+        dream.refresh_from_db()
+        self.assertEqual(dream.heart_count, 2)
+        self.assertEqual(self.buffer.toggle(dream, self.user), (False, 1))
+        self.buffer.flush()
+        self.assertEqual(DreamReaction.objects.count(), 1)
+        self.assertEqual(reconcile_heart_counts(), 0)
+
+    def test_full_buffer_is_flushed_before_taking_more(self):
+        for dream in self.dreams:
+            self.buffer.toggle(dream, self.user)
+        self.assertEqual(DreamReaction.objects.count(), 2)
+        self.assertEqual(len(self.buffer), 1)
+
+    @override_settings(DREAM_REACTION_WRITE_BEHIND=True)
+    def test_view_answers_from_buffer(self):
+        client = make_client(self.user)
+        dream = self.dreams[0]
+        with mock.patch("app.reaction_buffer.get_buffer", return_value=self.buffer):
+            self.assertEqual(self.feed_counts(client)[str(dream.id)], 0)
+            with CaptureQueriesContext(connection) as captured:
+                response = client.post(f"/app/dreams/{dream.id}/react/")
+            self.assertEqual(response.data["heart_count"], 1)
+            self.assertFalse([q for q in captured.captured_queries if q["sql"].startswith(("INSERT", "UPDATE"))])
+
+            status = client.get(f"/app/dreams/reactions/?ids={dream.id}").data["results"]
+            self.assertEqual(status[str(dream.id)], {"count": 1, "hearted": True})
+            feed = client.get("/app/dreams/public/?include=hearted").data["results"]
+            self.assertEqual({item["id"] for item in feed if item["hearted"]}, {str(dream.id)})
+            # Cached feed pages are rebuilt with the buffered toggle counted in
+            self.assertEqual(self.feed_counts(client)[str(dream.id)], 1)
+            self.assertEqual(self.feed_counts(client, "/app/async/dreams/public/")[str(dream.id)], 1)
+
+            self.buffer.flush()
+            self.assertEqual(self.feed_counts(client)[str(dream.id)], 1)
+        self.assertTrue(DreamReaction.objects.filter(dream=dream, user=self.user).exists())
+
+    def feed_counts(self, client, url="/app/dreams/public/"):
+        results = json.loads(client.get(url).content)["results"]
+        return {item["id"]: item["reactions"][0]["count"] for item in results}
+
+
+class ProjectionTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.user.profile.full_name = "Dréamer ✨"
+        self.user.profile.save()
+        self.no_profile = User.objects.create_user(username="ghost", email="ghost@example.com")
+        Dream.objects.create(user=self.user, title="Ünïcode 🌙", content="line\nbreak \"quoted\"",
+                             mood="Happy", tags=["sea", "sky"])
+        Dream.objects.create(user=self.user, title="Private", content="...", is_public=False, tags=[])
+        Dream.objects.create(user=self.no_profile, title="Orphan", content="...", mood=None)
+        dream = Dream.objects.create(user=self.user, title="Round", content="...")
+        Dream.objects.filter(pk=dream.pk).update(created_at=now().replace(microsecond=0), heart_count=3)
+
+    def assertSameJSON(self, expected, actual):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(actual), renderer.render(expected))
+
+    def test_projections_match_serializers(self):
+        for tz in ["UTC", "Asia/Kolkata"]:
+            with timezone.override(tz):
+                dreams = Dream.objects.order_by("created_at")
+                self.assertSameJSON(DreamSerializer(dreams, many=True).data, DREAMS.serialize(dreams))
+
+                public = Dream.objects.filter(is_public=True).order_by("created_at")
+                self.assertSameJSON(
+                    PublicDreamSerializer(public.select_related("user__profile"), many=True).data,
+                    PUBLIC_DREAMS.serialize(public),
+                )
+
+
+class SparseFieldsetTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+        Dream.objects.create(user=self.user, title="Long", content="x" * 500, tags=["sea"])
+        Dream.objects.create(user=self.user, title="Short", content="tiny")
+
+    def test_fields_limit_payload_and_columns(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get("/app/dreams/public/?fields=title,profiles")
+        self.assertEqual(set(response.data["results"][0]), {"title", "profiles"})
+        sql = captured.captured_queries[-1]["sql"]
+        self.assertNotIn('"content"', sql)
+        self.assertNotIn('"tags"', sql)
+
+        response = self.client.get("/app/dreams/?fields=id,mood")
+        self.assertEqual([set(item) for item in response.data], [{"id", "mood"}] * 2)
+        # The caller's hearts are keyed by id, which is added when left out
+        response = self.client.get("/app/dreams/public/?fields=title&include=hearted")
+        self.assertEqual(set(response.data["results"][0]), {"id", "title", "hearted"})
+
+    def test_excerpt_is_cut_by_the_database(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get("/app/dreams/?excerpt=100&fields=title,content")
+        self.assertIn("SUBSTR", captured.captured_queries[-1]["sql"].upper())
+        contents = {item["title"]: item["content"] for item in response.data}
+        self.assertEqual(contents, {"Long": "x" * 100 + "\u2026", "Short": "tiny"})
+
+    def test_invalid_fieldsets_are_rejected(self):
+        for query in ["fields=title,password", "excerpt=0", "excerpt=abc", "excerpt=10001",
+                      "excerpt=99999999999999999999999"]:
+            self.assertEqual(self.client.get(f"/app/dreams/public/?{query}").status_code, 400)
+            self.assertEqual(self.client.get(f"/app/dreams/?{query}").status_code, 400)
+            self.assertEqual(self.client.get(f"/app/async/dreams/?{query}").status_code, 400)
+
+
+@override_settings(DREAM_CACHE_SHARED=True)
+class CompressionTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+        for i in range(10):
+            Dream.objects.create(user=self.user, title=f"Dream {i}", content="I was flying over the sea. " * 20)
+
+    def test_large_responses_are_gzipped(self):
+        plain = self.client.get("/app/dreams/")
+        response = self.client.get("/app/dreams/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertTrue(response["ETag"].startswith("W/"))
+
+        revalidated = self.client.get("/app/dreams/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+        small = self.client.get("/app/auth/me/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+        refused = self.client.get("/app/dreams/", HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(refused.has_header("Content-Encoding"))
+
+    def test_feed_pages_are_compressed_once(self):
+        plain = self.client.get("/app/dreams/public/")
+        first = self.client.get("/app/dreams/public/", HTTP_ACCEPT_ENCODING="gzip")
+        with mock.patch("app.views.compress") as compress:
+            second = self.client.get("/app/dreams/public/", HTTP_ACCEPT_ENCODING="gzip")
+        compress.assert_not_called()
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(gzip.decompress(second.content), plain.content)
+
+        # Each encoding has its own ETag, which still revalidates
+        self.assertNotEqual(first["ETag"], plain["ETag"])
+        self.assertTrue(first["ETag"].startswith("W/"))
+        revalidated = self.client.get("/app/dreams/public/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_streaming_export_stays_streamed(self):
+        plain = b"".join(self.client.get("/app/dreams/export/").streaming_content)
+        response = self.client.get("/app/dreams/export/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), plain)
+
+    async def test_async_views_are_compressed(self):
+        token = await Token.objects.aget(user=self.user)
+        headers = {"Authorization": f"Token {token.key}"}
+        plain = await self.async_client.get("/app/async/dreams/", headers=headers)
+        response = await self.async_client.get("/app/async/dreams/", headers={**headers, "Accept-Encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+
+class TrendingTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def counters(self):
+        return sorted(TrendingCounter.objects.values_list("resolution", "bucket_start", "kind", "value", "count"))
+
+    def test_counters_follow_public_dreams(self):
+        first = Dream.objects.create(user=self.user, title="A", content="...", mood="calm", tags=["sea", "sky"])
+        Dream.objects.create(user=self.user, title="B", content="...", mood="calm", tags=["sea"])
+        Dream.objects.create(user=self.user, title="C", content="...", mood="scared", tags=["sea"], is_public=False)
+
+        response = self.client.get("/app/dreams/trending/?window=hour")
+        self.assertEqual(response.data["tags"], [{"tag": "sea", "count": 2}, {"tag": "sky", "count": 1}])
+        self.assertEqual(response.data["moods"], [{"mood": "calm", "count": 2}])
+        self.assertEqual(self.client.get("/app/dreams/trending/?window=hour")["X-Cache"], "HIT")
+
+        first.tags = ["forest"]
+        first.save()
+        private = Dream.objects.get(title="C")
+        private.is_public = True
+        private.save()
+        Dream.objects.get(title="B").delete()
+
+        response = self.client.get("/app/dreams/trending/?window=week&limit=1")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["tags"], [{"tag": "forest", "count": 1}])
+        self.assertEqual(len(response.data["moods"]), 1)
+
+        # The incremental counters agree with a rebuild from the Dream table
+        incremental = self.counters()
+        trending.rebuild()
+        self.assertEqual(self.counters(), incremental)
+
+    def test_windows_expire_and_compact(self):
+        Dream.objects.create(user=self.user, title="A", content="...", tags=["sea"])
+        later = timezone.now() + timedelta(hours=2)
+        self.assertEqual(trending.get_trending("hour", 10, later)["tags"], [])
+        self.assertEqual(trending.get_trending("day", 10, later)["tags"], [{"tag": "sea", "count": 1}])
+
+        self.assertEqual(trending.compact(later), 1)
+        self.assertEqual(sorted(TrendingCounter.objects.values_list("resolution", flat=True)), [3600, 86400])
+        call_command("compact_trending", stdout=StringIO())
+        self.assertEqual(TrendingCounter.objects.count(), 2)
+
+        self.assertEqual(self.client.get("/app/dreams/trending/?window=year").status_code, 400)
+
+
+class ArchiveTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.other = make_user("other")
+        self.client = make_client(self.user)
+        old = now() - timedelta(days=400)
+        for i, public in enumerate([True, False]):
+            dream = Dream.objects.create(user=self.user, title=f"Old {i}", content="...", mood="calm",
+                                         tags=["sea"], is_public=public)
+            Dream.objects.filter(pk=dream.pk).update(created_at=old + timedelta(minutes=i))
+        self.recent = Dream.objects.create(user=self.user, title="Recent", content="...", mood="scared", tags=["sky"])
+        rebuild_daily_stats()
+        self.old_public = Dream.objects.get(title="Old 0")
+        toggle_heart(self.old_public, self.other)
+        toggle_heart(self.recent, self.other)
+
+    def test_archived_dreams_stay_readable_and_counted(self):
+        before = get_analytics(self.user)
+        out = StringIO()
+        call_command("archive_dreams", "--batch-size", "1", stdout=out)
+        self.assertIn("Archived 2 dream(s)", out.getvalue())
+        self.assertEqual(list(Dream.objects.values_list("title", flat=True)), ["Recent"])
+        self.assertEqual(ArchivedDream.objects.count(), 2)
+
+        # Totals, moods and tags still include the archived dreams, also after a rebuild
+        self.assertEqual(get_analytics(self.user), before)
+        rebuild_daily_stats()
+        self.assertEqual(get_analytics(self.user), before)
+
+        detail = self.client.get(f"/app/dreams/{self.old_public.pk}/")
+        self.assertEqual((detail.status_code, detail.data["title"]), (200, "Old 0"))
+        response = self.client.put(f"/app/dreams/{self.old_public.pk}/", {"title": "New"}, format="json")
+        self.assertEqual(response.status_code, 409)
+
+        page = self.client.get("/app/dreams/older/?page_size=1").data
+        self.assertEqual([d["title"] for d in page["results"]], ["Old 1"])
+        page = self.client.get(f"/app/dreams/older/?page_size=1&cursor={page['next']}").data
+        self.assertEqual(([d["title"] for d in page["results"]], page["next"]), (["Old 0"], None))
+        public = self.client.get("/app/dreams/older/?scope=public").data["results"]
+        self.assertEqual([(d["title"], d["reactions"]) for d in public], [("Old 0", [{"count": 1}])])
+        self.assertNotIn("Old 0", [d["title"] for d in self.client.get("/app/dreams/").data])
+
+        # Resuming finds nothing left to move
+        call_command("archive_dreams", stdout=StringIO())
+        self.assertEqual(ArchivedDream.objects.count(), 2)
+
+    def test_dreams_still_trending_are_not_archived(self):
+        with self.assertRaisesMessage(CommandError, "after 7 days"):
+            call_command("archive_dreams", "--days", "6", stdout=StringIO())
+        with override_settings(DREAM_ARCHIVE_AFTER_DAYS=1), self.assertRaises(CommandError):
+            call_command("archive_dreams", stdout=StringIO())
+        self.assertEqual(ArchivedDream.objects.count(), 0)
+
+    def test_deletes_clean_up_tags_and_reactions(self):
+        call_command("archive_dreams", stdout=StringIO())
+        self.assertEqual(self.client.delete(f"/app/dreams/{self.old_public.pk}/").status_code, 204)
+        self.assertEqual(self.client.delete(f"/app/dreams/{self.recent.pk}/").status_code, 204)
+
+        self.assertFalse(DreamReaction.objects.exists())
+        self.assertEqual(list(DreamTag.objects.values_list("tag", flat=True)), ["sea"])
+        self.assertEqual(get_analytics(self.user)["totalDreams"], 1)
+        self.assertEqual(self.client.get(f"/app/dreams/{self.old_public.pk}/").status_code, 404)
+
+
+class DreamBatchTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+        self.sea = Dream.objects.create(user=self.user, title="Sea", content="...", mood="calm", tags=["sea"])
+        self.private = Dream.objects.create(user=self.user, title="Private", content="...", is_public=False)
+        self.doomed = Dream.objects.create(user=self.user, title="Doomed", content="...", tags=["sea"])
+        toggle_heart(self.doomed, make_user("other"))
+        self.foreign = Dream.objects.create(user=make_user("stranger"), title="Foreign", content="...")
+
+    def post(self, operations):
+        return self.client.post("/app/dreams/batch/", {"operations": operations}, format="json")
+
+    def test_mixed_operations_report_per_operation(self):
+        response = self.post([
+            {"op": "create", "data": {"title": "New", "content": "...", "mood": "calm", "tags": ["sky"]}},
+            {"op": "create", "data": {"content": "no title"}},
+            {"op": "update", "id": str(self.sea.pk), "data": {"tags": ["forest"], "mood": "scared"}},
+            {"op": "update", "id": str(self.private.pk), "data": {"is_public": True}},
+            {"op": "delete", "id": str(self.doomed.pk)},
+            {"op": "delete", "id": str(self.sea.pk)},
+            {"op": "update", "id": str(self.foreign.pk), "data": {"title": "Mine now"}},
+            {"op": "delete", "id": "not-a-uuid"},
+            {"op": "move"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["applied"], response.data["failed"]), (4, 5))
+        self.assertEqual([r["status"] for r in response.data["results"]], [201, 400, 200, 200, 204, 400, 404, 400, 400])
+        self.assertIn("title", response.data["results"][1]["errors"])
+        self.assertEqual(response.data["results"][2]["data"]["tags"], ["forest"])
+
+        self.sea.refresh_from_db()
+        self.assertEqual((self.sea.mood, self.sea.tags), ("scared", ["forest"]))
+        self.assertGreater(self.sea.updated_at, self.sea.created_at)
+        self.assertFalse(Dream.objects.filter(pk=self.doomed.pk).exists())
+        self.assertFalse(DreamReaction.objects.exists())
+        self.assertEqual(Dream.objects.get(title="Foreign").user.username, "stranger")
+
+        # The derived tables match a rebuild from the dreams
+        self.assertEqual(sorted(DreamTag.objects.values_list("tag", flat=True)), ["forest", "sky"])
+        analytics = get_analytics(self.user)
+        self.assertEqual(analytics["totalDreams"], 3)
+        rebuild_daily_stats()
+        self.assertEqual(get_analytics(self.user), analytics)
+        counters = sorted(TrendingCounter.objects.values_list("resolution", "bucket_start", "kind", "value", "count"))
+        trending.rebuild()
+        self.assertEqual(
+            sorted(TrendingCounter.objects.values_list("resolution", "bucket_start", "kind", "value", "count")),
+            counters,
+        )
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def run(size):
+            operations = [{"op": "create", "data": {"title": f"D{n}", "content": "...", "tags": ["sea"]}}
+                          for n in range(size)]
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.post(operations).data["applied"], size)
+            return len(captured)
+
+        run(1)
+        self.assertEqual(run(2), run(20))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        with override_settings(DREAM_BATCH_MAX_OPERATIONS=1):
+            self.assertEqual(self.post([{"op": "delete", "id": str(self.sea.pk)}] * 2).status_code, 400)
+        self.assertEqual(self.client.get("/app/dreams/not-a-uuid/").status_code, 404)
+
+
+@skipUnless(similar.np is not None, "NumPy and SciPy are not installed")
+class SimilarDreamsTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        settings_override = override_settings(DREAM_SIMILAR_INDEX_DIR=index_dir, DREAM_SIMILAR_FEATURES=2 ** 12)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+        self.ocean = self.dream("Swimming in the ocean", "Waves carried me far out into the ocean", ["ocean"])
+        self.waves = self.dream("Ocean waves", "Huge waves and a warm ocean breeze", ["ocean"])
+        self.forest = self.dream("Lost in a forest", "Tall trees and a narrow path through the forest", ["forest"])
+        self.dream("Private ocean", "Ocean waves again", ["ocean"], is_public=False)
+
+    def dream(self, title, content, tags, is_public=True):
+        return Dream.objects.create(user=self.user, title=title, content=content, tags=tags, is_public=is_public)
+
+    def similar(self, dream):
+        response = self.client.get(f"/app/dreams/{dream.pk}/similar/")
+        self.assertEqual(response.status_code, 200)
+        return [(d["title"], d["score"]) for d in response.data["results"]]
+
+    def test_ranks_public_dreams_by_similarity(self):
+        self.assertEqual(self.client.get(f"/app/dreams/{self.ocean.pk}/similar/").status_code, 501)
+        # Nothing is recorded until there is a build to apply it to
+        self.assertFalse(SimilarDreamVector.objects.exists())
+        call_command("build_similar_index", stdout=StringIO())
+
+        results = self.similar(self.ocean)
+        self.assertEqual([title for title, _ in results], ["Ocean waves", "Lost in a forest"])
+        self.assertTrue(1 >= results[0][1] > results[1][1] > 0)
+        private = Dream.objects.get(title="Private ocean")
+        self.assertEqual(self.client.get(f"/app/dreams/{private.pk}/similar/").status_code, 404)
+
+    def test_changes_apply_before_the_next_build(self):
+        call_command("build_similar_index", stdout=StringIO())
+        surf = self.dream("Surfing the ocean", "Riding waves on the ocean", ["ocean"])
+        self.waves.is_public = False
+        self.waves.save()
+        self.forest.title = "Ocean forest"
+        self.forest.save()
+        self.assertEqual(SimilarDreamVector.objects.count(), 3)
+
+        titles = [title for title, _ in self.similar(self.ocean)]
+        self.assertEqual(titles, ["Surfing the ocean", "Ocean forest"])
+        self.client.delete(f"/app/dreams/{surf.pk}/")
+        self.assertEqual([title for title, _ in self.similar(self.ocean)], ["Ocean forest"])
+
+        # A rebuild folds the changes in and gives the same answer
+        call_command("build_similar_index", stdout=StringIO())
+        self.assertFalse(SimilarDreamVector.objects.exists())
+        self.assertEqual([title for title, _ in self.similar(self.ocean)], ["Ocean forest"])
+
+    @override_settings(DREAM_SIMILAR_MAX_DELTA=2)
+    def test_large_deltas_queue_a_rebuild(self):
+        call_command("build_similar_index", stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dream("Sailing", "A boat on the ocean", ["ocean"])
+        self.assertFalse(Job.objects.exists())
+        for title in ["Diving", "Fishing"]:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.dream(title, "Deep in the ocean", ["ocean"])
+        self.assertEqual(list(Job.objects.values_list("name", flat=True)), ["similar.build"])
+
+
+class JobQueueTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+
+    def test_dedupe_key_keeps_one_queued_job(self):
+        first = jobs.enqueue("reactions.reconcile", dedupe_key="reactions.reconcile")
+        second = jobs.enqueue("reactions.reconcile", dedupe_key="reactions.reconcile")
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+        with self.assertRaises(jobs.UnknownJob):
+            jobs.enqueue("no.such.job")
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        job = jobs.enqueue("reactions.reconcile", max_attempts=2)
+        with mock.patch("app.tasks.reconcile_heart_counts", side_effect=RuntimeError("boom")), \
+                self.assertLogs("app.jobs", "ERROR"):
+            self.assertEqual(jobs.work("test"), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+            self.assertGreater(job.run_at, timezone.now())
+            self.assertIn("boom", job.last_error)
+            # Not due yet
+            self.assertEqual(jobs.work("test"), 0)
+
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            jobs.work("test")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_worker_survives_database_errors(self):
+        jobs.enqueue("reactions.reconcile")
+        claim = jobs.claim
+        calls = []
+
+        def flaky_claim(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return claim(*args, **kwargs)
+
+        with mock.patch("app.jobs.claim", side_effect=flaky_claim), \
+                mock.patch("app.management.commands.run_jobs.close_old_connections"), \
+                self.assertLogs("app.management.commands.run_jobs", "ERROR"):
+            call_command("run_jobs", "--once", "--poll-interval", "0", stdout=StringIO())
+        self.assertGreater(len(calls), 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_stale_locks_are_requeued(self):
+        job = jobs.enqueue("reactions.reconcile")
+        self.assertEqual([j.pk for j in jobs.claim("lost-worker")], [job.pk])
+        self.assertEqual(jobs.claim("other-worker"), [])
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.QUEUED, 1, None))
+
+    def test_analytics_are_rebuilt_inline_without_a_shared_cache(self):
+        Dream.objects.create(user=self.user, title="A", content="...")
+        self.assertEqual(self.client.get("/app/analytics/")["X-Cache"], "MISS")
+
+        self.client.post("/app/dreams/", {"title": "B", "content": "..."}, format="json")
+        fresh = self.client.get("/app/analytics/")
+        self.assertEqual((fresh["X-Cache"], fresh.data["totalDreams"]), ("MISS", 2))
+        self.assertFalse(Job.objects.exists())
+
+    # A shared cache alone does not mean a worker will run the refresh
+    @override_settings(DREAM_CACHE_SHARED=True)
+    def test_analytics_are_rebuilt_inline_without_a_worker(self):
+        Dream.objects.create(user=self.user, title="A", content="...")
+        self.client.get("/app/analytics/")
+        self.client.post("/app/dreams/", {"title": "B", "content": "..."}, format="json")
+        fresh = self.client.get("/app/analytics/")
+        self.assertEqual((fresh["X-Cache"], fresh.data["totalDreams"]), ("MISS", 2))
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(DREAM_JOBS_EAGER=True)
+    def test_eager_refresh_answers_with_fresh_analytics(self):
+        Dream.objects.create(user=self.user, title="A", content="...")
+        self.client.get("/app/analytics/")
+        self.client.post("/app/dreams/", {"title": "B", "content": "..."}, format="json")
+        fresh = self.client.get("/app/analytics/")
+        self.assertEqual((fresh["X-Cache"], fresh.data["totalDreams"]), ("MISS", 2))
+
+    # The worker stores into the same cache as the web process
+    @override_settings(DREAM_CACHE_SHARED=True, DREAM_JOBS_WORKER=True)
+    def test_analytics_are_served_stale_and_refreshed_by_a_job(self):
+        Dream.objects.create(user=self.user, title="A", content="...")
+        self.assertEqual(self.client.get("/app/analytics/")["X-Cache"], "MISS")
+
+        self.client.post("/app/dreams/", {"title": "B", "content": "..."}, format="json")
+        stale = self.client.get("/app/analytics/")
+        self.assertEqual((stale["X-Cache"], stale.data["totalDreams"]), ("STALE", 1))
+        self.client.get("/app/analytics/")
+        self.assertEqual(Job.objects.filter(name="analytics.refresh").count(), 1)
+
+        # The worker runs in this thread, inside the test transaction
+        with mock.patch("app.management.commands.run_jobs.close_old_connections"):
+            call_command("run_jobs", "--once", stdout=StringIO())
+        self.assertFalse(Job.objects.exists())
+        fresh = self.client.get("/app/analytics/")
+        self.assertEqual((fresh["X-Cache"], fresh.data["totalDreams"]), ("HIT", 2))
+
+    @override_settings(DREAM_JOBS_EAGER=True)
+    def test_eager_mode_runs_inline(self):
+        dream = Dream.objects.create(user=self.user, title="A", content="...")
+        Dream.objects.filter(pk=dream.pk).update(heart_count=7)
+        call_command("reconcile_heart_counts", "--defer", stdout=StringIO())
+        dream.refresh_from_db()
+        self.assertEqual(dream.heart_count, 0)
+        self.assertFalse(Job.objects.exists())
+
+
+@mock.patch("app.routers.replica_alias", return_value="replica")
+class ReplicaRoutingTests(DreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dreamer")
+        self.client = make_client(self.user)
+        routers.mark_refreshed(timezone.now())
+
+    def test_router_sends_only_replica_reads_outside_transactions(self, _):
+        router = routers.ReplicaRouter()
+        with mock.patch.object(connections["default"], "in_atomic_block", False):
+            self.assertEqual(router.db_for_read(Dream), "default")
+            with routers.reading_from_replica(self.user.id):
+                self.assertEqual(router.db_for_read(Dream), "replica")
+                self.assertEqual(router.db_for_write(Dream), "default")
+        # Reads inside a transaction see its writes
+        with routers.reading_from_replica(self.user.id):
+            self.assertEqual(router.db_for_read(Dream), "default")
+        self.assertFalse(router.allow_migrate("replica", "app"))
+
+    def test_replica_is_not_read_before_its_first_refresh(self, _):
+        ReplicaRefresh.objects.all().delete()
+        with routers.reading_from_replica(self.user.id) as enabled:
+            self.assertFalse(enabled)
+            self.assertEqual(routers.read_alias(), "default")
+
+    def test_user_reads_own_writes_from_primary_until_the_next_refresh(self, _):
+        seen = []
+
+        def spy():
+            seen.append(routers.read_alias())
+            return seen[-1]
+
+        with mock.patch("app.views.read_alias", side_effect=spy):
+            self.client.get("/app/dreams/")
+            snapshot = seen[-1]
+            self.assertTrue(snapshot.startswith("replica@"))
+
+            self.client.post("/app/dreams/", {"title": "New", "content": "..."}, format="json")
+            response = self.client.get("/app/dreams/")
+            self.assertEqual(seen[-1], "default")
+            self.assertEqual([d["title"] for d in response.data], ["New"])
+
+            # Other users keep reading from the replica
+            make_client(make_user("other")).get("/app/dreams/public/")
+            self.assertEqual(seen[-1], snapshot)
+
+            # Pinned however long the replica lags, then unpinned by a
+            # refresh that includes the write, under new cache keys
+            ReplicaPin.objects.update(written_at=timezone.now() - timedelta(hours=1))
+            ReplicaRefresh.objects.update(started_at=timezone.now() - timedelta(hours=2))
+            self.client.get("/app/dreams/")
+            self.assertEqual(seen[-1], "default")
+            routers.mark_refreshed(timezone.now())
+            self.assertFalse(ReplicaPin.objects.exists())
+            self.client.get("/app/dreams/")
+            self.assertTrue(seen[-1].startswith("replica@"))
+            self.assertNotEqual(seen[-1], snapshot)
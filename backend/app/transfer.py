@@ -0,0 +1,120 @@
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import ArchivedDream, Dream
+from .projections import DREAMS
+from .serializers import DreamSerializer
+from .signals import dreams_created
+
+MAX_REPORTED_ERRORS = 1000
+
+
+def export_lines(user):
+    """
+    Yield the user's dreams as NDJSON lines, archived ones first, oldest
+    first, in constant memory.
+    """
+    chunk_size = getattr(settings, "DREAM_EXPORT_CHUNK_SIZE", 500)
+    encoder = JSONEncoder(ensure_ascii=False)
+    for model in (ArchivedDream, Dream):
+        dreams = model.objects.filter(user=user).order_by("created_at", "id")
+        for data in DREAMS.iterator(dreams, chunk_size):
+            yield encoder.encode(data) + "\n"
+
+
+def _parse_created_at(row):
+    """
+    The exported created_at of a row, None when it has none. Raises
+    ValueError for a value that is not an ISO 8601 datetime.
+    """
+    value = row.get("created_at")
+    if value is None:
+        return None
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError("Not an ISO 8601 datetime")
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        # Read as local time, like Django's DateTimeField does
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _insert_batch(batch):
+    with transaction.atomic():
+        Dream.objects.bulk_create(batch)
+        # auto_now_add overwrote created_at, restore exported timestamps
+        restored = []
+        for dream in batch:
+            if dream._imported_created_at is not None:
+                dream.created_at = dream._imported_created_at
+                restored.append(dream)
+        if restored:
+            Dream.objects.bulk_update(restored, ["created_at"])
+        dreams_created(batch)
+
+
+def import_lines(user, lines, batch_size):
+    """
+    Validate NDJSON lines with DreamSerializer and insert the valid rows with
+    bulk_create, one transaction per batch. Invalid rows are reported by line
+    number and skipped. Returns a dict of counts and the reported errors.
+    """
+    created = 0
+    public_created = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    def report(line_number, error):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_number, "errors": error})
+
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            row = json.loads(line)
+        except ValueError:
+            report(line_number, {"non_field_errors": ["Invalid JSON"]})
+            continue
+        if not isinstance(row, dict):
+            report(line_number, {"non_field_errors": ["Expected a JSON object"]})
+            continue
+
+        serializer = DreamSerializer(data=row)
+        if not serializer.is_valid():
+            report(line_number, serializer.errors)
+            continue
+
+        try:
+            created_at = _parse_created_at(row)
+        except ValueError as e:
+            report(line_number, {"created_at": [str(e)]})
+            continue
+
+        dream = Dream(user=user, **serializer.validated_data)
+        dream._imported_created_at = created_at
+        batch.append(dream)
+        if len(batch) >= batch_size:
+            _insert_batch(batch)
+            created += len(batch)
+            public_created += sum(1 for d in batch if d.is_public)
+            batch = []
+
+    if batch:
+        _insert_batch(batch)
+        created += len(batch)
+        public_created += sum(1 for d in batch if d.is_public)
+
+    return {"created": created, "public_created": public_created, "failed": failed, "errors": errors}
@@ -0,0 +1,134 @@
+import datetime
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .counters import apply_counter_deltas
+from .models import Dream, TrendingCounter
+from .tags import normalize_tags
+
+# Window name -> (length, bucket length in seconds). Each window is read
+# from its own resolution, so a query touches at most 12, 24 or 7 buckets
+WINDOWS = {
+    "hour": (timedelta(hours=1), 300),
+    "day": (timedelta(days=1), 3600),
+    "week": (timedelta(days=7), 86400),
+}
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def bucket_start(moment, resolution):
+    seconds = int((moment - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def counted_values(tags, mood):
+    """The (kind, value) pairs a public dream counts towards."""
+    values = [(TrendingCounter.TAG, tag) for tag in normalize_tags(tags)]
+    mood = (mood or "").strip()
+    if mood:
+        values.append((TrendingCounter.MOOD, mood))
+    return values
+
+
+def dream_deltas(created_at, tags, mood, sign=1, now=None, deltas=None):
+    """
+    Add the counter increments of one public dream to `deltas`, a dict of
+    {(resolution, bucket_start, kind, value): delta}. Buckets that already
+    fell out of their window are skipped, nothing reads them anymore.
+    """
+    now = now or timezone.now()
+    deltas = {} if deltas is None else deltas
+    values = counted_values(tags, mood)
+    for length, resolution in WINDOWS.values():
+        start = bucket_start(created_at, resolution)
+        if start <= now - length:
+            continue
+        for kind, value in values:
+            key = (resolution, start, kind, value)
+            deltas[key] = deltas.get(key, 0) + sign
+    return deltas
+
+
+def apply_deltas(deltas):
+    """Apply counter increments in one transaction, dropping rows that reach zero."""
+    with transaction.atomic():
+        apply_counter_deltas(TrendingCounter, ('resolution', 'bucket_start', 'kind', 'value'), deltas)
+
+
+def record_dreams(dreams, sign=1):
+    now = timezone.now()
+    deltas = {}
+    for dream in dreams:
+        if dream.is_public:
+            dream_deltas(dream.created_at, dream.tags, dream.mood, sign, now, deltas)
+    apply_deltas(deltas)
+
+
+def record_changes(changes):
+    """
+    Move dreams' counts from their old (is_public, tags, mood) to the new
+    ones, given (created_at, old, new) per dream. Values present in both
+    cancel out and are not written.
+    """
+    now = timezone.now()
+    deltas = {}
+    for created_at, old, new in changes:
+        if old[0]:
+            dream_deltas(created_at, old[1], old[2], -1, now, deltas)
+        if new[0]:
+            dream_deltas(created_at, new[1], new[2], 1, now, deltas)
+    apply_deltas(deltas)
+
+
+def get_trending(window, limit, now=None):
+    """
+    Top tags and moods of public dreams created in the window, to the
+    granularity of its buckets.
+    """
+    length, resolution = WINDOWS[window]
+    now = now or timezone.now()
+    rows = (TrendingCounter.objects
+            .filter(resolution=resolution, bucket_start__gt=now - length)
+            .values('kind', 'value')
+            .annotate(total=Sum('count'))
+            .order_by('-total', 'value'))
+    tags, moods = [], []
+    for row in rows:
+        if row['kind'] == TrendingCounter.TAG and len(tags) < limit:
+            tags.append({'tag': row['value'], 'count': row['total']})
+        elif row['kind'] == TrendingCounter.MOOD and len(moods) < limit:
+            moods.append({'mood': row['value'], 'count': row['total']})
+    return {'window': window, 'tags': tags, 'moods': moods}
+
+
+def compact(now=None):
+    """Delete buckets that are entirely outside their window, returns how many."""
+    now = now or timezone.now()
+    deleted = 0
+    for length, resolution in WINDOWS.values():
+        deleted += TrendingCounter.objects.filter(
+            resolution=resolution, bucket_start__lte=now - length
+        ).delete()[0]
+    return deleted
+
+
+def rebuild(batch_size=2000):
+    """Recompute every live bucket from the public dreams of the last week."""
+    now = timezone.now()
+    longest = max(length for length, _ in WINDOWS.values())
+    dreams = (Dream.objects.filter(is_public=True, created_at__gt=now - longest)
+              .values_list('created_at', 'tags', 'mood'))
+    deltas = {}
+    for created_at, tags, mood in dreams.iterator(chunk_size=batch_size):
+        dream_deltas(created_at, tags, mood, 1, now, deltas)
+    with transaction.atomic():
+        TrendingCounter.objects.all().delete()
+        TrendingCounter.objects.bulk_create(
+            (TrendingCounter(resolution=r, bucket_start=s, kind=k, value=v, count=c)
+             for (r, s, k, v), c in deltas.items() if c > 0),
+            batch_size=batch_size,
+        )
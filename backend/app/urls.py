@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import LoginView, RegisterView, LogOutView, MeView, DreamListCreateAPIView, DreamDetailAPIView, PublicDreamsView, ToggleReactionView, ProfileView, AnalyticsView
+from .async_views import AsyncPublicDreamsView, AsyncDreamListView, AsyncAnalyticsView
+from .views import LoginView, RegisterView, LogOutView, MeView, DreamListCreateAPIView, DreamBatchView, DreamDetailAPIView, PublicDreamsView, OlderDreamsView, TrendingView, ToggleReactionView, SimilarDreamsView, ReactionStatusView, ProfileView, AnalyticsView, DreamSearchView, DreamExportView, DreamImportView, MetricsView
 
 urlpatterns = [
     path("analytics/", AnalyticsView.as_view(), name="analytics"),
@@ -7,9 +8,23 @@ urlpatterns = [
     path("auth/register/", RegisterView.as_view(), name="register"),
     path("auth/me/", MeView.as_view(), name="me"),
     path("auth/logout/", LogOutView.as_view(), name="logout"),
-    path("dreams/public/", PublicDreamsView.as_view()),
-    path("dreams/", DreamListCreateAPIView.as_view()),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("dreams/public/", PublicDreamsView.as_view(), name="public-dreams"),
+    path("dreams/older/", OlderDreamsView.as_view(), name="dream-older"),
+    path("dreams/trending/", TrendingView.as_view(), name="dream-trending"),
+    path("dreams/search/", DreamSearchView.as_view(), name="dream-search"),
+    path("dreams/export/", DreamExportView.as_view(), name="dream-export"),
+    path("dreams/import/", DreamImportView.as_view(), name="dream-import"),
+    path("dreams/reactions/", ReactionStatusView.as_view(), name="dream-reactions"),
+    path("dreams/batch/", DreamBatchView.as_view(), name="dream-batch"),
+    path("dreams/", DreamListCreateAPIView.as_view(), name="dreams"),
     path("dreams/<str:pk>/", DreamDetailAPIView.as_view(), name="dream-detail"),
-    path("dreams/<uuid:id>/react/", ToggleReactionView.as_view()),
-    path("auth/profile/", ProfileView.as_view())
+    path("dreams/<uuid:id>/react/", ToggleReactionView.as_view(), name="dream-react"),
+    path("dreams/<uuid:id>/similar/", SimilarDreamsView.as_view(), name="dream-similar"),
+    path("auth/profile/", ProfileView.as_view(), name="profile"),
+
+    # Async variants of the read-heavy endpoints, for ASGI deployments
+    path("async/analytics/", AsyncAnalyticsView.as_view(), name="async-analytics"),
+    path("async/dreams/public/", AsyncPublicDreamsView.as_view(), name="async-public-dreams"),
+    path("async/dreams/", AsyncDreamListView.as_view(), name="async-dreams"),
 ]
\ No newline at end of file
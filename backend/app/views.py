@@ -1,20 +1,36 @@
-from .models import Profile, Dream, DreamReaction
+from .models import Profile, ArchivedDream, Dream, DreamTag
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from .authentication import CachedTokenAuthentication
 from .serializers import RegisterSerializer, LoginSerializer, MeSerializer, DreamSerializer, PublicDreamSerializer, ProfileSerializer, AnalyticsSerializer
-from django.utils.timezone import   now
-from django.db.models import Count
-from django.db.models.functions import TruncDate
-from datetime import timedelta
-from collections import Counter
-
-
+from .pagination import KeysetPaginator, InvalidCursor, get_page_size
+from .search import SearchUnavailable, build_match_query, search_page
+from .transfer import export_lines, import_lines
+from .batch import InvalidBatch, apply_batch
+from .metrics import registry as metrics_registry
+from .reactions import embed_hearted, hearted_ids, reaction_status, toggle_heart, with_buffered_counts
+from .analytics import get_analytics
+from . import cache, jobs, reaction_buffer, similar, trending
+from .projections import DREAMS, PUBLIC_DREAMS, InvalidFieldset
+from .compression import compress, mark_encoded, min_compressed_size, negotiate
+from .etags import conditional, dreams_etag, public_feed_etag, analytics_etag, profile_etag
+from .routers import pin_to_primary, read_alias, replica_reads
+from django.utils import timezone
+from django.utils.timezone import localdate
+
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+
+import uuid
 
 class RegisterView(APIView):
     def post(self, request):
@@ -63,7 +79,7 @@ class LoginView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class LogOutView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -74,7 +90,7 @@ class LogOutView(APIView):
             return Response(status=status.HTTP_200_OK)
         
 class MeView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
@@ -84,69 +100,347 @@ class MeView(APIView):
     
 class DreamListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
+    # GET /dreams/?tag=<tag>&fields=id,title,...&excerpt=<characters>
+    @replica_reads
+    @conditional(dreams_etag)
     def get(self, request):
-        dreams = Dream.objects.filter(user=request.user)
-        serializer = DreamSerializer(dreams, many=True)
-        return Response(serializer.data)
+        tag = request.query_params.get("tag")
+        try:
+            projection = DREAMS.from_params(request.query_params)
+        except InvalidFieldset as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        def build():
+            dreams = Dream.objects.filter(user=request.user)
+
+            # Filter by tag through the (user, tag) index
+            if tag:
+                dreams = dreams.filter(
+                    id__in=DreamTag.objects.filter(user=request.user, tag=tag).values("dream_id")
+                )
+
+            return projection.serialize(dreams)
+
+        data, hit = cache.get_or_build(
+            "dreams", cache.user_scope(request.user.id), [tag, read_alias(), projection.cache_key], build
+        )
+        return Response(data, headers={"X-Cache": "HIT" if hit else "MISS"})
 
     def post(self, request):
         serializer = DreamSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            dream = serializer.save(user=request.user)
+            cache.bump_user(request.user.id)
+            pin_to_primary(request.user.id)
+            if dream.is_public:
+                cache.bump_public()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class PublicDreamsView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    # GET /dreams/public/?cursor=...&page_size=...&fields=...&excerpt=...&include=hearted
+    @replica_reads
+    @conditional(public_feed_etag)
     def get(self, request):
-        dreams = Dream.objects.filter(is_public=True).order_by("-created_at")
-        serializer = PublicDreamSerializer(dreams, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = KeysetPaginator(request)
+        include_hearted = "hearted" in request.query_params.get("include", "").split(",")
+        try:
+            projection = PUBLIC_DREAMS.from_params(request.query_params, required=["id"] if include_hearted else [])
+        except InvalidFieldset as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        def build():
+            rows, next_cursor = with_buffered_counts(
+                lambda: paginator.paginate(projection.rows(Dream.objects.filter(is_public=True)))
+            )
+            return paginator.get_response_data(projection.map(rows), next_cursor)
+
+        parts = [paginator.cursor, paginator.page_size, read_alias(), projection.cache_key]
+        encoding = None if include_hearted else negotiate(request)
+        try:
+            if encoding and request.accepted_renderer.format == "json":
+                return self.precompressed(request, parts, encoding, build)
+            data, hit = cache.get_or_build("public", cache.PUBLIC_SCOPE, parts, build)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # ?include=hearted adds the caller's own reaction state with one query
+        if include_hearted:
+            ids = [item["id"] for item in data["results"]]
+            data = embed_hearted(data, hearted_ids(ids, request.user) if ids else ())
+
+        return Response(data, status=status.HTTP_200_OK, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+    def precompressed(self, request, parts, encoding, build):
+        """
+        Feed pages are the same for everyone, so hot pages are rendered and
+        compressed once and the encoded body is cached next to the data.
+        """
+        renderer = request.accepted_renderer
+
+        def build_body():
+            data, _ = cache.get_or_build("public", cache.PUBLIC_SCOPE, parts, build)
+            body = renderer.render(data, request.accepted_media_type, self.get_renderer_context())
+            if len(body) < min_compressed_size():
+                return None, body
+            return encoding, compress(body, encoding)
+
+        (body_encoding, body), hit = cache.get_or_build(
+            "public-body", cache.PUBLIC_SCOPE, parts + [request.accepted_media_type, encoding], build_body
+        )
+        content_type = renderer.media_type + (f"; charset={renderer.charset}" if renderer.charset else "")
+        response = HttpResponse(body, content_type=content_type)
+        response["X-Cache"] = "HIT" if hit else "MISS"
+        if body_encoding:
+            mark_encoded(response, body_encoding, len(body))
+        else:
+            patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+
+class OlderDreamsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # GET /dreams/older/?scope=mine|public&cursor=...&page_size=...&fields=...&excerpt=...
+    # Dreams moved out of the hot table by archive_dreams, newest first
+    @replica_reads
+    def get(self, request):
+        scope = request.query_params.get("scope", "mine")
+        if scope not in ("mine", "public"):
+            return Response({"error": "scope must be 'mine' or 'public'"}, status=status.HTTP_400_BAD_REQUEST)
+        public = scope == "public"
+
+        paginator = KeysetPaginator(request)
+        try:
+            projection = (PUBLIC_DREAMS if public else DREAMS).from_params(request.query_params)
+        except InvalidFieldset as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        def build():
+            if public:
+                dreams = ArchivedDream.objects.filter(is_public=True)
+            else:
+                dreams = ArchivedDream.objects.filter(user=request.user)
+            rows, next_cursor = paginator.paginate(projection.rows(dreams))
+            return paginator.get_response_data(projection.map(rows), next_cursor)
+
+        cache_scope = cache.PUBLIC_SCOPE if public else cache.user_scope(request.user.id)
+        parts = [paginator.cursor, paginator.page_size, read_alias(), projection.cache_key]
+        try:
+            data, hit = cache.get_or_build("older-" + scope, cache_scope, parts, build)
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data, status=status.HTTP_200_OK, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+
+class TrendingView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # GET /dreams/trending/?window=hour|day|week&limit=<n>
+    @replica_reads
+    def get(self, request):
+        window = request.query_params.get("window", "day")
+        if window not in trending.WINDOWS:
+            return Response(
+                {"error": f"window must be one of: {', '.join(trending.WINDOWS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        default = getattr(settings, "DREAM_TRENDING_LIMIT", 10)
+        try:
+            limit = int(request.query_params.get("limit", default))
+        except ValueError:
+            limit = default
+        limit = max(1, min(limit, getattr(settings, "DREAM_TRENDING_MAX_LIMIT", 50)))
+
+        # The window slides one bucket at a time, public writes bump the scope
+        _, resolution = trending.WINDOWS[window]
+        now = timezone.now()
+        parts = [window, limit, str(trending.bucket_start(now, resolution)), read_alias()]
+        data, hit = cache.get_or_build(
+            "trending", cache.PUBLIC_SCOPE, parts, lambda: trending.get_trending(window, limit, now)
+        )
+        return Response(data, status=status.HTTP_200_OK, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+
+class DreamSearchView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # GET /dreams/search/?q=<text>&scope=mine|public
+    def get(self, request):
+        match = build_match_query(request.query_params.get("q"))
+        if not match:
+            return Response({"error": "A search query is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope = request.query_params.get("scope", "mine")
+        if scope not in ("mine", "public"):
+            return Response({"error": "scope must be 'mine' or 'public'"}, status=status.HTTP_400_BAD_REQUEST)
+        public = scope == "public"
+
+        try:
+            results, next_cursor = search_page(
+                match,
+                get_page_size(request),
+                cursor=request.query_params.get("cursor"),
+                user=request.user,
+                public=public,
+            )
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except SearchUnavailable as e:
+            return Response({"error": str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        serializer_class = PublicDreamSerializer if public else DreamSerializer
+        data = []
+        for dream, snippet in results:
+            item = serializer_class(dream).data
+            item["snippet"] = snippet
+            data.append(item)
+
+        return Response({"results": data, "next": next_cursor}, status=status.HTTP_200_OK)
+
+
+class DreamExportView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # GET /dreams/export/ -> one JSON object per line
+    def get(self, request):
+        response = StreamingHttpResponse(export_lines(request.user), content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="dreams.ndjson"'
+        return response
+
+
+class DreamImportView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # POST /dreams/import/ with an NDJSON body or a multipart "file" upload
+    def post(self, request):
+        default_size = getattr(settings, "DREAM_IMPORT_BATCH_SIZE", 500)
+        try:
+            batch_size = int(request.query_params.get("batch_size", default_size))
+        except ValueError:
+            batch_size = default_size
+        batch_size = max(1, min(batch_size, getattr(settings, "DREAM_IMPORT_MAX_BATCH_SIZE", 5000)))
+
+        if request.content_type.startswith("multipart/form-data"):
+            upload = request.FILES.get("file")
+            if upload is None:
+                return Response({"error": "Upload an NDJSON file as 'file'"}, status=status.HTTP_400_BAD_REQUEST)
+            lines = upload
+        else:
+            # Read the raw body line by line instead of parsing it as a whole
+            lines = iter(request._request.readline, b"")
+
+        result = import_lines(request.user, lines, batch_size)
+
+        if result["created"]:
+            cache.bump_user(request.user.id)
+            pin_to_primary(request.user.id)
+            if result["public_created"]:
+                cache.bump_public()
+
+        return Response(
+            {"created": result["created"], "failed": result["failed"], "errors": result["errors"]},
+            status=status.HTTP_201_CREATED if result["created"] else status.HTTP_400_BAD_REQUEST
+        )
+
+
+class DreamBatchView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # POST /dreams/batch/ {"operations": [{"op": "create", "data": {...}},
+    #                                     {"op": "update", "id": <id>, "data": {...}},
+    #                                     {"op": "delete", "id": <id>}]}
+    def post(self, request):
+        operations = request.data.get("operations") if isinstance(request.data, dict) else None
+        try:
+            results, touched_public = apply_batch(request.user, operations)
+        except InvalidBatch as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        applied = sum(1 for result in results if result["status"] < 400)
+        if applied:
+            cache.bump_user(request.user.id)
+            pin_to_primary(request.user.id)
+            if touched_public:
+                cache.bump_public()
+        return Response(
+            {"applied": applied, "failed": len(results) - applied, "results": results},
+            status=status.HTTP_200_OK
+        )
 
 
 class DreamDetailAPIView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
-    # Helper method
+    # Helper methods, None for a malformed id as well
     def get_object(self, pk, user):
         try:
-            a = Dream.objects.get(id=pk, user=user)
-            print(a)
             return Dream.objects.get(id=pk, user=user)
-        except Dream.DoesNotExist:
+        except (Dream.DoesNotExist, ValidationError):
+            return None
+
+    def get_archived(self, pk, user):
+        try:
+            return ArchivedDream.objects.get(id=pk, user=user)
+        except (ArchivedDream.DoesNotExist, ValidationError):
             return None
 
+    # GET /dreams/<id>/, archived dreams included
+    @replica_reads
+    def get(self, request, pk):
+        dream = self.get_object(pk, request.user) or self.get_archived(pk, request.user)
+        if not dream:
+            return Response({"error": "Dream not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(DreamSerializer(dream).data)
+
     # PUT /dreams/<id>/
     def put(self, request, pk):
         dream = self.get_object(pk, request.user)
         if not dream:
+            if self.get_archived(pk, request.user):
+                return Response({"error": "Archived dreams are read-only"}, status=status.HTTP_409_CONFLICT)
             return Response({"error": "Dream not found"}, status=status.HTTP_404_NOT_FOUND)
 
+        was_public = dream.is_public
         serializer = DreamSerializer(dream, data=request.data, partial=True)
-        print(serializer)
         if serializer.is_valid():
             serializer.save()    # user remains same
+            cache.bump_user(request.user.id)
+            pin_to_primary(request.user.id)
+            if was_public or dream.is_public:
+                cache.bump_public()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # DELETE /dreams/<id>/
+    # DELETE /dreams/<id>/, archived dreams included
     def delete(self, request, pk):
-        dream = self.get_object(pk, request.user)
+        dream = self.get_object(pk, request.user) or self.get_archived(pk, request.user)
         if not dream:
             return Response({"error": "Dream not found"}, status=status.HTTP_404_NOT_FOUND)
 
         dream.delete()
+        cache.bump_user(request.user.id)
+        pin_to_primary(request.user.id)
+        if dream.is_public:
+            cache.bump_public()
         return Response({"message": "Dream deleted"}, status=status.HTTP_204_NO_CONTENT)
 
 
 class ToggleReactionView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, id):
@@ -165,39 +459,86 @@ class ToggleReactionView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check if reaction already exists
-        existing = DreamReaction.objects.filter(
-            dream=dream,
-            user=request.user,
-            reaction_type="heart"
-        ).first()
-
-        if existing:
-            # Remove reaction
-            existing.delete()
-            action = "unhearted"
+        if reaction_buffer.is_enabled():
+            # Written later by the buffer's flusher, feed pages built until
+            # then count it in from the buffer
+            hearted, heart_count = reaction_buffer.get_buffer().toggle(dream, request.user)
         else:
-            # Add new reaction
-            DreamReaction.objects.create(
-                dream=dream,
-                user=request.user,
-                reaction_type="heart"
-            )
-            action = "hearted"
-
-        # Updated count
-        heart_count = dream.reactions.filter(reaction_type="heart").count()
+            hearted, heart_count = toggle_heart(dream, request.user)
+        cache.bump_public()
+        pin_to_primary(request.user.id)
+        action = "hearted" if hearted else "unhearted"
 
         return Response({
             "message": f"Dream {action} successfully",
-            "heart_count": heart_count
+            "heart_count": heart_count,
+            "hearted": hearted,
         }, status=status.HTTP_200_OK)
 
 
+class SimilarDreamsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # GET /dreams/<id>/similar/?limit=<n>
+    @replica_reads
+    def get(self, request, id):
+        dream = Dream.objects.filter(pk=id, is_public=True).only("id", "title", "content", "tags").first()
+        if not dream:
+            return Response({"error": "Dream not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        default = getattr(settings, "DREAM_SIMILAR_LIMIT", 10)
+        try:
+            limit = int(request.query_params.get("limit", default))
+        except ValueError:
+            limit = default
+        limit = max(1, min(limit, getattr(settings, "DREAM_SIMILAR_MAX_LIMIT", 50)))
+
+        def build():
+            matches = similar.similar_to(dream, limit)
+            rows = {
+                row["id"]: row
+                for row in PUBLIC_DREAMS.serialize(Dream.objects.filter(pk__in=[pk for pk, _ in matches], is_public=True))
+            }
+            return {"results": [
+                dict(rows[str(pk)], score=round(score, 4)) for pk, score in matches if str(pk) in rows
+            ]}
+
+        try:
+            data, hit = cache.get_or_build("similar", cache.PUBLIC_SCOPE, [str(id), limit, read_alias()], build)
+        except similar.SimilarityUnavailable as e:
+            return Response({"error": str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        return Response(data, status=status.HTTP_200_OK, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+
+class ReactionStatusView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    # GET /dreams/reactions/?ids=<id>,<id>,... -> {"results": {id: {"count", "hearted"}}}
+    def get(self, request):
+        raw = [i for i in request.query_params.get("ids", "").split(",") if i]
+        if not raw:
+            return Response({"error": "ids is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        maximum = getattr(settings, "DREAM_REACTION_STATUS_MAX_IDS", 100)
+        if len(raw) > maximum:
+            return Response({"error": f"At most {maximum} ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            dream_ids = {uuid.UUID(i) for i in raw}
+        except ValueError:
+            return Response({"error": "ids must be dream ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = reaction_status(dream_ids, request.user)
+        return Response({"results": {str(pk): value for pk, value in results.items()}}, status=status.HTTP_200_OK)
+
+
 class ProfileView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @conditional(profile_etag)
     def get(self, request):
         try:
             profile = Profile.objects.get(user=request.user)
@@ -228,74 +569,52 @@ class ProfileView(APIView):
 
         if serializer.is_valid():
             serializer.save()
+            cache.bump_profile(request.user.id)
+            # Profiles are embedded in the public feed
+            cache.bump_public()
+            pin_to_primary(request.user.id)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class AnalyticsView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @replica_reads
+    @conditional(analytics_etag)
     def get(self, request):
-        user = request.user
-        dreams = Dream.objects.filter(user=user)
-
-        # Total dreams count
-        total_dreams = dreams.count()
-
-        # This month count
-        now_dt = now()
-        this_month_count = dreams.filter(
-            created_at__year=now_dt.year,
-            created_at__month=now_dt.month
-        ).count()
-
-        # Most common mood
-        mood_counts = dreams.values('mood').annotate(count=Count('mood')).order_by('-count')
-        most_common_mood = mood_counts[0]['mood'] if mood_counts else None
-
-        # Top tags
-        all_tags = []
-        for d in dreams:
-            if isinstance(d.tags, list):
-                all_tags.extend(d.tags)
-        tag_counter = Counter(all_tags)
-        top_tags = [{'tag': tag, 'count': count} for tag, count in tag_counter.most_common()]
-
-        # Mood distribution
-        mood_dist = [{'mood': m['mood'], 'count': m['count']} for m in mood_counts]
-
-        # recent activity
-        start_date = now_dt - timedelta(days=13)
-        date_counts = (dreams.filter(created_at__date__gte=start_date.date())
-                       .annotate(day=TruncDate('created_at'))
-                       .values('day')
-                       .annotate(count=Count('id'))
-                       .order_by('day'))
-        daily_map = {entry['day']: entry['count'] for entry in date_counts}
-
-        recent_activity = []
-        for i in range(14):
-            day = (start_date + timedelta(days=i)).date()
-            recent_activity.append({
-                'date': day,
-                'count': daily_map.get(day, 0)
-            })
-
-        # Prepare response data
-        data = {
-            'totalDreams': total_dreams,
-            'thisMonth': this_month_count,
-            'mostCommonMood': most_common_mood,
-            'topTags': top_tags,
-            'moodDistribution': mood_dist,
-            'recentActivity': recent_activity
-        }
-
-        serializer = AnalyticsSerializer(data)
-        return Response(serializer.data, status=200)
+        # recentActivity is relative to today, so the day is part of the key
+        parts = [str(localdate()), read_alias()]
+        user_id = request.user.id
+
+        def build():
+            return AnalyticsSerializer(get_analytics(request.user)).data
+
+        if jobs.is_eager() or (cache.is_shared() and jobs.has_worker()):
+            # After a write, answer with the previous figures and recompute
+            # them in the job queue, deduplicated per user. Only where a
+            # worker runs the job and what it stores reaches this process's
+            # cache.
+            data, state = cache.get_or_refresh(
+                "analytics", cache.user_scope(user_id), parts, build,
+                lambda: jobs.enqueue("analytics.refresh", user_id, parts, dedupe_key=f"analytics.refresh:{user_id}"),
+            )
+        else:
+            data, hit = cache.get_or_build("analytics", cache.user_scope(user_id), parts, build)
+            state = "HIT" if hit else "MISS"
+        headers = {"X-Cache": state}
+        if state == "STALE":
+            # Not the representation the current ETag stands for
+            headers["ETag"] = quote_etag(f"analytics-{user_id}-stale")
+        return Response(data, status=200, headers=headers)
 
-    
 
+class MetricsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
 
+    # GET /metrics/ in Prometheus text format, staff only
+    def get(self, request):
+        return HttpResponse(metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middleware.InstrumentationMiddleware',
+    'app.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +64,17 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'config.urls'
 
+# Per-view timing, Server-Timing headers and the app/metrics/ endpoint.
+# Set DREAM_INSTRUMENTATION=0 to take the middleware out of the stack.
+DREAM_INSTRUMENTATION = os.environ.get('DREAM_INSTRUMENTATION', '1') == '1'
+
+# gzip (or brotli, if the brotli package is installed) for responses of at
+# least DREAM_COMPRESSION_MIN_SIZE bytes, see app/compression.py
+DREAM_COMPRESSION = os.environ.get('DREAM_COMPRESSION', '1') == '1'
+DREAM_COMPRESSION_MIN_SIZE = int(os.environ.get('DREAM_COMPRESSION_MIN_SIZE', 1024))
+DREAM_GZIP_LEVEL = 6
+DREAM_BROTLI_QUALITY = 5
+
 RESt_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES":[
         "rest_framework.authentication.TokenAuthentication"
@@ -68,6 +84,50 @@ RESt_FRAMEWORK = {
     ],
 }
 
+# Public dream feed pagination
+DREAM_FEED_PAGE_SIZE = 20
+DREAM_FEED_MAX_PAGE_SIZE = 100
+# Longest ?excerpt= the list endpoints cut content to
+DREAM_MAX_EXCERPT = 10000
+
+# Dreams per request to the batch reaction status endpoint
+DREAM_REACTION_STATUS_MAX_IDS = 100
+
+# Dreams older than this many days are moved to the archive table by
+# `manage.py archive_dreams` (see app/archive.py)
+DREAM_ARCHIVE_AFTER_DAYS = int(os.environ.get('DREAM_ARCHIVE_AFTER_DAYS', 365))
+DREAM_ARCHIVE_BATCH_SIZE = 500
+
+# Similar dreams (see app/similar.py), needs NumPy and SciPy. The index is
+# built by `manage.py build_similar_index` and memory-mapped by every worker,
+# changes since the last build are kept in the database until the next one.
+DREAM_SIMILAR_DREAMS = os.environ.get('DREAM_SIMILAR_DREAMS', '1') == '1'
+DREAM_SIMILAR_INDEX_DIR = os.environ.get('DREAM_SIMILAR_INDEX_DIR', str(BASE_DIR / 'similar_index'))
+DREAM_SIMILAR_FEATURES = 2 ** 18
+DREAM_SIMILAR_LIMIT = 10
+DREAM_SIMILAR_MAX_LIMIT = 50
+# Queue a rebuild (the similar.build job) once this many changes wait for one
+DREAM_SIMILAR_MAX_DELTA = int(os.environ.get('DREAM_SIMILAR_MAX_DELTA', 5000))
+
+# Trending tags and moods (see app/trending.py), entries per list
+DREAM_TRENDING_LIMIT = 10
+DREAM_TRENDING_MAX_LIMIT = 50
+
+# Write-behind heart toggles (see app/reaction_buffer.py). Toggles are kept in
+# memory, answered with the projected count and written every
+# DREAM_REACTION_FLUSH_INTERVAL seconds, or earlier once the buffer is full.
+DREAM_REACTION_WRITE_BEHIND = os.environ.get('DREAM_REACTION_WRITE_BEHIND', '') == '1'
+DREAM_REACTION_BUFFER_SIZE = int(os.environ.get('DREAM_REACTION_BUFFER_SIZE', 10000))
+DREAM_REACTION_FLUSH_INTERVAL = float(os.environ.get('DREAM_REACTION_FLUSH_INTERVAL', 1.0))
+
+# Operations per request to the batch write endpoint
+DREAM_BATCH_MAX_OPERATIONS = 500
+
+# Dream export/import
+DREAM_EXPORT_CHUNK_SIZE = 500
+DREAM_IMPORT_BATCH_SIZE = 500
+DREAM_IMPORT_MAX_BATCH_SIZE = 5000
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -99,13 +159,101 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Applied to every new SQLite connection by app.signals.configure_sqlite.
+# WAL lets readers run alongside the single writer, busy_timeout makes a
+# writer wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Negative values are in KiB
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Keep connections open between requests
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
     }
 }
 
+if django.VERSION >= (5, 1):
+    # Take the write lock when a transaction starts, so a transaction that
+    # reads and then writes can wait on busy_timeout instead of failing
+    DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+# Read replica for the feed, dream list and analytics GETs (see app/routers.py).
+# Set SQLITE_REPLICA_PATH to a second SQLite file and keep it current with
+# `manage.py refresh_replica --interval N`. After each of their writes,
+# users read from the primary until the next refresh has copied it.
+DREAM_REPLICA_ALIAS = 'replica'
+
+if os.environ.get('SQLITE_REPLICA_PATH'):
+    DATABASES[DREAM_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        'NAME': os.environ['SQLITE_REPLICA_PATH'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        # Tests read and write a single database
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['app.routers.ReplicaRouter']
+
+
+# Cache
+# Response caching for dream lists, the public feed and analytics (see app/cache.py).
+# Local memory by default; set DREAM_CACHE_DIR to share a file cache between workers.
+
+if os.environ.get('DREAM_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['DREAM_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+DREAM_CACHE_ALIAS = 'default'
+# ETags are only sent when cache versions are shared by all workers
+DREAM_CACHE_SHARED = bool(os.environ.get('DREAM_CACHE_DIR'))
+# Set DREAM_JOBS_WORKER=1 only when `manage.py run_jobs` is running against
+# the shared cache above: analytics are then answered stale and refreshed by
+# a job, which would otherwise never run.
+DREAM_JOBS_WORKER = os.environ.get('DREAM_JOBS_WORKER', '') == '1'
+DREAM_CACHE_TIMEOUT = int(os.environ.get('DREAM_CACHE_TIMEOUT', 300))
+
+# Background jobs (see app/jobs.py), run by `manage.py run_jobs`. With
+# DREAM_JOBS_EAGER=1 they run inline instead, for setups without a worker.
+DREAM_JOBS_EAGER = os.environ.get('DREAM_JOBS_EAGER', '') == '1'
+DREAM_JOB_MAX_ATTEMPTS = 5
+# Retry after 2s, 4s, 8s, ... at most an hour
+DREAM_JOB_BACKOFF = 2
+DREAM_JOB_BACKOFF_MAX = 3600
+# Running jobs older than this are assumed lost with their worker
+DREAM_JOB_LOCK_TIMEOUT = 600
+# How long a superseded response is kept to be served while it is rebuilt
+DREAM_CACHE_STALE_TIMEOUT = 86400
+
+# Token authentication cache (see app/authentication.py)
+DREAM_AUTH_CACHE_SIZE = int(os.environ.get('DREAM_AUTH_CACHE_SIZE', 1024))
+DREAM_AUTH_CACHE_TTL = int(os.environ.get('DREAM_AUTH_CACHE_TTL', 60))
+DREAM_AUTH_CACHE_SHARED = os.environ.get('DREAM_AUTH_CACHE_SHARED', '') == '1'
+DREAM_AUTH_CACHE_ALIAS = 'default'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -15,10 +15,16 @@ interface Dream {
     // avatar_url: string | null;
   };
   reactions: { count: number }[];
+  hearted?: boolean;
 }
 
+// The cards show every field and the full content, so the default fieldset
+// is asked for and the pages share the API's cached copies
+const FEED_QUERY = 'include=hearted';
+
 export default function DreamFeed() {
   const [dreams, setDreams] = useState<Dream[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
   const { user } = useAuth();
 
@@ -28,9 +34,10 @@ export default function DreamFeed() {
 
     const loadDreams = async () => {
         try {
-          const data = await api.get('/dreams/public/'); // Adjust endpoint
+          const data = await api.get(`/dreams/public/?${FEED_QUERY}`); // Adjust endpoint
             console.log(data)
-          setDreams(data || []);
+          setDreams(data?.results || []);
+          setNextCursor(data?.next || null);
         } catch (error) {
           console.error('Error loading dreams:', error);
         } finally {
@@ -38,13 +45,29 @@ export default function DreamFeed() {
         }
     };
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        try {
+          const data = await api.get(`/dreams/public/?${FEED_QUERY}&cursor=${encodeURIComponent(nextCursor)}`);
+          setDreams((prev) => [...prev, ...(data?.results || [])]);
+          setNextCursor(data?.next || null);
+        } catch (error) {
+          console.error('Error loading more dreams:', error);
+        }
+    };
 
     const handleReaction = async (dreamId: string) => {
         if (!user) return;
         try {
-          // Assumes a toggle endpoint for liking
-          await api.post(`/dreams/${dreamId}/react/`, { type: 'heart' });
-          loadDreams(); // Reload to get updated counts
+          const data = await api.post(`/dreams/${dreamId}/react/`, { type: 'heart' });
+          // Update the card in place, reloading would drop the pages loaded so far
+          setDreams((prev) =>
+            prev.map((dream) =>
+              dream.id === dreamId
+                ? { ...dream, hearted: data.hearted, reactions: [{ count: data.heart_count }] }
+                : dream
+            )
+          );
         } catch (error) {
           console.error('Error handling reaction:', error);
         }
@@ -130,7 +153,7 @@ export default function DreamFeed() {
                   onClick={() => handleReaction(dream.id)}
                   className="flex items-center space-x-2 text-purple-600 hover:text-purple-700 transition-colors"
                 >
-                  <Heart className="w-5 h-5" />
+                  <Heart className={`w-5 h-5 ${dream.hearted ? 'fill-current' : ''}`} />
                   <span className="text-sm font-medium">
                     {dream.reactions[0]?.count || 0}
                   </span>
@@ -142,6 +165,14 @@ export default function DreamFeed() {
               </div>
             </div>
           ))}
+          {nextCursor && (
+            <button
+              onClick={loadMore}
+              className="w-full py-3 text-purple-600 font-medium bg-white rounded-2xl border border-purple-100 hover:bg-purple-50 transition-colors"
+            >
+              Load more
+            </button>
+          )}
         </div>
       )}
     </div>